@@ -5,3 +5,9 @@ class BaseAgent(metaclass=ABCMeta):
     @abstractmethod
     def serve(self, query):
         pass
+
+    def warm_up(self):
+        pass
+
+    def shutdown(self):
+        pass
@@ -1,2 +1,5 @@
 INPUT_REQUIRED = "input_required"
-END = "end"
\ No newline at end of file
+END = "end"
+DISPLAY = "display"
+# Set for the MCP servers of workers, the only ones that run code
+WARM_UP_KERNELS_ENV_VAR = "HEY_WARM_UP_KERNELS"
@@ -3,20 +3,20 @@ import time
 import json
 import copy
 import pickle
-import dotenv
+import psutil
 import logging
 import threading
 import traceback
-import subprocess
-from multiprocessing import Pool
-import multiprocessing as mp
+from concurrent.futures import ThreadPoolExecutor
 
-from hey.utils.misc import set_log
 from hey.agents.base import BaseAgent
+from hey.utils.cache import get_cache_dir
 from hey.agents.basic.critic import BasicCritic
 from hey.agents.basic.planner import BasicPlanner
-from hey.agents.basic.const import END, INPUT_REQUIRED
-from hey.mcp_tools.sync_client import get_mcp_client
+from hey.agents.basic.scheduler import DagScheduler
+from hey.agents.basic.worker import create_worker_pool, prepare_worker
+from hey.agents.basic.const import END, INPUT_REQUIRED, DISPLAY
+from hey.mcp_tools.sync_client import get_mcp_client, close_mcp_client
 
 dir_path = os.path.dirname(os.path.realpath(__file__))
 
@@ -33,33 +33,85 @@ class BasicAgent(BaseAgent):
         )
         self.critic = BasicCritic(config.critic, environment)
         self.config = config
+        self.scheduler = DagScheduler()
+        self.worker_pool = None
+        # Overridden (e.g., by the daemon) when the user is not on this terminal
+        self.input_handler = None
+
+    def __getstate__(self):
+        # The scheduler and the pool live in the main process only and hold locks,
+        # so they must not be shipped to workers along with `process_a_task`
+        state = self.__dict__.copy()
+        del state['scheduler']
+        del state['worker_pool']
+        del state['input_handler']
+        return state
+
+    def warm_up(self):
+        self.get_worker_pool()
+        self.planner.warm_up()
+
+    def get_worker_pool(self):
+        # Workers outlive a single query so that their MCP sessions stay warm
+        if self.worker_pool is None:
+            self.worker_pool = create_worker_pool(
+                config=self.config,
+                log_path=self.environment.get_log_path()
+            )
+        return self.worker_pool
+
+    def terminate_worker_pool(self):
+        if self.worker_pool is not None:
+            self.worker_pool.terminate()
+            self.worker_pool.join()
+            self.worker_pool = None
+
+    def shutdown(self):
+        # Taken first, as servers of workers that end are no longer our descendants
+        descendants = psutil.Process().children(recursive=True)
+        if self.worker_pool is not None:
+            # close() rather than terminate() lets workers run their finalizers
+            self.worker_pool.close()
+            self.worker_pool.join()
+            self.worker_pool = None
+        close_mcp_client()  # the planner's
+        self.environment.close()
+
+        # Only our own MCP servers left behind, not those of other runs (e.g., a daemon)
+        for process in descendants:
+            try:
+                if any(arg.endswith("server.py") for arg in process.cmdline()):
+                    process.kill()
+            except psutil.NoSuchProcess:
+                pass
+
+    @property
+    def all_tasks(self):
+        return self.scheduler.tasks
 
-        self.all_tasks = {}
-        self.completed_task_names = []
-        self.running_task_names = []
-        self.pending_task_names = []
+    def display(self, text):  # called in workers, whose output is printed by the main process
+        self.environment.publish_a_message(channel=DISPLAY, message=text)
 
     def preprocessing_display(self, task):
         print_tag = "[Execution]"
-        print(f"\n{print_tag} I now run task {task['name']} with tool {task['tool']}.\n"
-              f"\tDetail: {task['description'][:500]}...")
+        self.display(f"\n{print_tag} I now run task {task['name']} with tool {task['tool']}.\n"
+                     f"\tDetail: {task['description'][:500]}...")
 
     def evaluation_display(self, task, task_succeeded, evaluator_comment):
         print_tag = "[Evaluation]"
         if evaluator_comment:
-            print(f"\n{print_tag} According to my evaluation, task {task['name']} "
-                  f"{'succeeded' if task_succeeded else 'failed'} with score {evaluator_comment['score']}/10.\n"
-                  f"\tDetail: {evaluator_comment['explanation'][:500]}...")
+            self.display(f"\n{print_tag} According to my evaluation, task {task['name']} "
+                         f"{'succeeded' if task_succeeded else 'failed'} with score {evaluator_comment['score']}/10.\n"
+                         f"\tDetail: {evaluator_comment['explanation'][:500]}...")
         else:
-            print(f"\n{print_tag} According to my evaluation, task {task['name']} "
-                  f"{'succeeded' if task_succeeded else 'failed'}.")
+            self.display(f"\n{print_tag} According to my evaluation, task {task['name']} "
+                         f"{'succeeded' if task_succeeded else 'failed'}.")
 
     def process_a_task(self, overall_task, task):  # this run in a new process
         task_name = task['name']
         task_tool = task['tool']
-        dotenv.load_dotenv(dotenv_path='.env', override=True)
         log_path = self.environment.get_log_path()
-        set_log(log_path=log_path)
+        prepare_worker(log_path)
 
         logging.info(f'Starting to process task {task_name} with tool {task_tool}')
         begin_time = time.perf_counter()
@@ -68,7 +120,8 @@ class BasicAgent(BaseAgent):
         max_retries = self.config.task_retry_time_limit
         mcp_client = get_mcp_client(
             log_path=log_path,
-            server_script_file=self.config.mcp_server_script_file
+            server_script_file=self.config.mcp_server_script_file,
+            check_health=True  # the session may have gone stale since the last task
         )
         while retry_count <= max_retries:
             try:
@@ -118,6 +171,8 @@ class BasicAgent(BaseAgent):
             self.evaluation_display(task, task_succeeded, evaluator_comment)
             if task_succeeded:
                 break
+            # Otherwise, a retry with the same goal would get the same code from the cache
+            self.forget_cached_code(log_path, task_tool, task['arguments'])
 
             retry_count += 1
             if retry_count > max_retries:
@@ -133,103 +188,86 @@ class BasicAgent(BaseAgent):
         logging.info(f'Processing for task {task_name} with tool {task_tool} '
                      f'finished in {round(duration, 3)}s')
 
-    def relay_input_for_workers(self):  # in a separate thread of the main process
-        subscriber = self.environment.get_message_subscriber(
-            channels=[INPUT_REQUIRED, END]
-        )
+    @staticmethod
+    def forget_cached_code(log_path, task_tool, arguments):
+        from hey.backend.code.python import Python
+        from hey.backend.code.general_shell import Shell
+
+        handler_class = {"python_code_task": Python, "shell_code_task": Shell}.get(task_tool)
+        if handler_class is None or "specific_goal" not in arguments:
+            return
+        try:
+            handler = handler_class(cache_dir=get_cache_dir(log_path, "code"))
+            handler.forget_code(arguments["specific_goal"])
+        except Exception as e:
+            logging.warning(f"Failed to evict the cached code of a rejected task due to {e}")
+
+    def get_user_input(self, prompt):
+        if self.input_handler is not None:
+            return self.input_handler(prompt, self.INPUT_TIMEOUT)
+
+        from inputimeout import inputimeout, TimeoutOccurred
+        try:
+            return inputimeout(
+                prompt=prompt,
+                timeout=self.INPUT_TIMEOUT
+            )
+        except TimeoutOccurred:
+            return None
+
+    def relay_input_for_workers(self, subscriber):  # in a separate thread of the main process
         for message in subscriber.listen():
             raw_data = message['data']
             if not isinstance(raw_data, bytes):
                 continue
 
-            channel = message["channel"].decode()
+            channel = self.environment.get_message_channel(message)
             try:
                 data = pickle.loads(raw_data)
             except Exception as e:
                 logging.error(f'Unable to load data from channel {channel} due to {e}')
             if channel == INPUT_REQUIRED:
-                from inputimeout import inputimeout, TimeoutOccurred
-                try:
-                    user_input = inputimeout(
-                        prompt=data["prompt"],
-                        timeout=self.INPUT_TIMEOUT
-                    )
-                    logging.info(f"User input got (length: {len(user_input)}).")
-                except TimeoutOccurred:
+                user_input = self.get_user_input(data["prompt"])
+                if user_input is None:
                     user_input = ""
                     logging.error("Time's up! No user input received.")
+                else:
+                    logging.info(f"User input got (length: {len(user_input)}).")
 
                 self.environment.set_data_for_subprocess(
                     data=user_input,
                     target_pid=data["target_pid"]
                 )
+            elif channel == DISPLAY:
+                print(data)
             elif channel == END:
                 logging.info(f"Asked to quit")
                 break
-
-    def refresh_pending_tasks(self):
-        self.pending_task_names = []
-        for task_name in self.all_tasks.keys():
-            if (task_name not in self.running_task_names
-                    and task_name not in self.completed_task_names):
-                self.pending_task_names.append(task_name)
-
-    def pending_tasks_exist(self):
-        return len(self.pending_task_names) > 0
-
-    def running_tasks_exist(self):
-        return len(self.running_task_names) > 0
-
-    @staticmethod
-    def get_newly_finished_tasks(async_results):
-        return [
-            task_name for task_name, result in async_results.items()
-            if result.ready()
-        ]
+        subscriber.close()
 
     def set_tasks(self, task_list):
-        for task in task_list:
-            task_name = task["name"]
-            self.all_tasks[task_name] = task
-        self.refresh_pending_tasks()
-
+        self.scheduler.add_tasks(task_list)
         logging.info(f"Current plan:\n{json.dumps(self.all_tasks, indent=4)}")
 
-    def get_a_ready_task(self):
-        for task_name in self.pending_task_names:
-            task = self.all_tasks[task_name]
-            if set(task['dependencies']).issubset(self.completed_task_names):
-                return task
-        return None
+    def launch_a_task(self, pool, query, task, async_results):
+        task_name = task["name"]
+        scheduler = self.scheduler  # bound now, as the pool outlives this query
+        scheduler.mark_running(task_name)
+        async_results[task_name] = pool.apply_async(
+            self.process_a_task, (query, task),
+            callback=lambda _: scheduler.notify_finished(task_name),
+            error_callback=lambda _: scheduler.notify_finished(task_name)
+        )
 
     @staticmethod
     def propagate_exception(task_name, async_results):
         async_results[task_name].get(timeout=0)  # To propagate any exceptions
 
-    def mark_completed_task(self, task_name, async_results):
-        if task_name in self.running_task_names:
-            del async_results[task_name]
-            self.running_task_names.remove(task_name)
-        elif task_name in self.pending_task_names:
-            self.pending_task_names.remove(task_name)
-
-        self.completed_task_names.append(task_name)  # even originally pending task needs to be appended
-
-    def mark_running_task(self, task_name, result, async_results):
-        self.pending_task_names.remove(task_name)
-        self.running_task_names.append(task_name)
-        async_results[task_name] = result
-
     # This is a very trick operation
     def replace_a_task(self, original_task, new_task_list):
         original_task_name = original_task["name"]
-        del self.all_tasks[original_task_name]
-
         original_task_predecessors = original_task["dependencies"]
-        original_task_successors = []
-        for task_name, task in self.all_tasks.items():
-            if original_task_name in task["dependencies"]:
-                original_task_successors.append(task_name)
+        original_task_successors = self.scheduler.remove_task(original_task_name)
 
         # Step 1: Make sure that new_tasks use new_names
         # Step 1.1: Rename task in new_tasks, if necessary
@@ -256,7 +294,6 @@ class BasicAgent(BaseAgent):
         # Step 2: Align new_tasks with other tasks
         # Step 2.1: Align new_tasks with predecessors by adding necessary dependencies
         new_tasks_set = set(task['name'] for task in new_task_list)
-        new_tasks_that_dont_depend_on_any_other_in_the_list = set()
         for task in new_task_list:
             dont_depend_on_any_other_in_the_list = True
             for dependency in task['dependencies']:
@@ -264,8 +301,10 @@ class BasicAgent(BaseAgent):
                     dont_depend_on_any_other_in_the_list = False
 
             if dont_depend_on_any_other_in_the_list:
-                new_tasks_that_dont_depend_on_any_other_in_the_list.add(task['name'])
-                task['dependencies'] = original_task_predecessors
+                task['dependencies'] = list(original_task_predecessors)
+
+        # Avoid double replanning: the returned ready tasks are launched directly
+        newly_ready_tasks = self.scheduler.add_tasks(new_task_list, enqueue=False)
 
         # Step 2.2: Align new_tasks with successors by adding necessary dependencies
         tasks_that_no_one_depends_on = copy.deepcopy(new_tasks_set)
@@ -275,128 +314,144 @@ class BasicAgent(BaseAgent):
                     tasks_that_no_one_depends_on.remove(dependency)
         tasks_that_no_one_depends_on = list(tasks_that_no_one_depends_on)
         for task_name in original_task_successors:
-            self.all_tasks[task_name]['dependencies'].remove(original_task_name)
-            self.all_tasks[task_name]['dependencies'] += tasks_that_no_one_depends_on
+            self.scheduler.replace_dependency(
+                task_name=task_name,
+                old_dependency=original_task_name,
+                new_dependencies=tasks_that_no_one_depends_on
+            )
 
-        for task in new_task_list:
-            task_name = task["name"]
-            self.all_tasks[task_name] = task
-        self.refresh_pending_tasks()
-
-        # Avoid double replanning
-        newly_ready_tasks = []
-        for task_name, task in self.all_tasks.items():
-            if task_name in new_tasks_that_dont_depend_on_any_other_in_the_list:
-                newly_ready_tasks.append(task)
         return newly_ready_tasks
 
+    def launch_tasks(self, pool, query, task_list, async_results):
+        for task in task_list:
+            self.num_tasks_launched += 1
+            logging.info(f"Num tasks launched: {self.num_tasks_launched}")
+            if self.num_tasks_launched > self.config.max_num_tasks_launched:
+                logging.info(f"Exceeded max number of tasks. Aborting...")
+                return False
+            self.launch_a_task(pool, query, task, async_results)
+        return True
+
+    def apply_replan(self, task_name, future):
+        pending_task = self.all_tasks[task_name]
+        try:
+            adjust_result = future.result()
+        except Exception as e:
+            logging.error(f"Replanning for task {task_name} failed due to {e}\n"
+                          f"{traceback.format_exc()}")
+            adjust_result = {"choice": "retain"}
+
+        if adjust_result["choice"] == "retain":
+            return [pending_task]
+        elif adjust_result["choice"] == "remove":
+            self.scheduler.mark_completed(task_name)
+
+            dummy_result = ("Skipped as the task is already done before, "
+                            "or deemed as irrelevant")
+            self.environment.set_task_result(
+                task=pending_task,
+                result=dummy_result
+            )  # TODO: if the task is running, the task_state may be later overwritten
+            return []
+        else:  # choice == replace
+            return self.replace_a_task(
+                original_task=pending_task,
+                new_task_list=adjust_result["detail"]
+            )
+
     def serve(self, query):
         start_time = time.perf_counter()
         logging.info(f"Starting serving the query: {query}")
 
-        num_tasks_launched = 0
+        self.num_tasks_launched = 0
+        self.scheduler = DagScheduler()
+        # Replanning is a blocking LLM round trip, so tasks becoming ready
+        # together are replanned concurrently rather than one after another
+        replan_executor = ThreadPoolExecutor(
+            max_workers=self.config.max_concurrent_replans or self.config.max_workers
+        )
+        relay_thread = None
         try:
             all_tasks = self.planner.plan(query)
             self.set_tasks(all_tasks)
             async_results = {}
 
             # Because under the "spawn" start method, sub-processes cannot access the terminal input
-            t = threading.Thread(target=self.relay_input_for_workers)
-            t.start()
-
-            abort = False
-            mp.set_start_method("spawn", force=True)
-            with Pool(processes=self.config.max_workers) as pool:
-                # Loop until no pending tasks remain and all running tasks have finished
-                while self.pending_tasks_exist() or self.running_tasks_exist():
-
-                    # Step 1: Check which running tasks have completed
-                    newly_finished_tasks = self.get_newly_finished_tasks(async_results)
-                    for task_name in newly_finished_tasks:
-                        try:
-                            self.propagate_exception(task_name, async_results)
-                        except Exception as e:  # TODO: if necessary, deal with it
-                            logging.error(f"Task {task_name} not finished due to {e}\n"
-                                          f"{traceback.format_exc()}")
-                        self.mark_completed_task(task_name, async_results)
-
-                    # Step 2: Schedule any tasks whose dependencies are met
-                    while True:
-                        ready_task = self.get_a_ready_task()
-                        if not ready_task:
-                            break
-
-                        # Only try to replan for those tasks having dependencies
-                        if ready_task["dependencies"]:
-                            adjust_result = self.planner.replan(
-                                query=query,
-                                pending_task=ready_task
-                            )
-                            if adjust_result["choice"] == "retain":
-                                num_tasks_launched += 1
-                                logging.info(f"Num tasks launched: {num_tasks_launched}")
-                                if num_tasks_launched > self.config.max_num_tasks_launched:
-                                    logging.info(f"Exceeded max number of tasks. Aborting...")
-                                    abort = True
-                                    break
-                                result = pool.apply_async(self.process_a_task, (query, ready_task))
-                                self.mark_running_task(ready_task["name"], result, async_results)
-                            elif adjust_result["choice"] == "remove":
-                                self.mark_completed_task(ready_task["name"], async_results)
-
-                                dummy_result = ("Skipped as the task is already done before, "
-                                                "or deemed as irrelevant")
-                                self.environment.set_task_result(
-                                    task=ready_task,
-                                    result=dummy_result
-                                )  # TODO: if the task is running, the task_state may be later overwritten
-                            else:  # choice == replace
-                                derived_ready_tasks = self.replace_a_task(
-                                    original_task=ready_task,
-                                    new_task_list=adjust_result["detail"]
-                                )
-                                for derived_ready_task in derived_ready_tasks:
-                                    num_tasks_launched += 1
-                                    logging.info(f"Num tasks launched: {num_tasks_launched}")
-                                    if num_tasks_launched > self.config.max_num_tasks_launched:
-                                        logging.info(f"Exceeded max number of tasks. Aborting...")
-                                        abort = True
-                                        break
-                                    result = pool.apply_async(self.process_a_task, (query, derived_ready_task))
-                                    self.mark_running_task(derived_ready_task["name"], result, async_results)
-                                if abort:
-                                    break
-                        else:
-                            num_tasks_launched += 1
-                            logging.info(f"Num tasks launched: {num_tasks_launched}")
-                            if num_tasks_launched > self.config.max_num_tasks_launched:
-                                logging.info(f"Exceeded max number of tasks. Aborting...")
-                                abort = True
-                                break
-                            result = pool.apply_async(self.process_a_task, (query, ready_task))
-                            self.mark_running_task(ready_task["name"], result, async_results)
-                    if abort:
+            # Subscribing here rather than in the thread so that no early message is missed
+            subscriber = self.environment.get_message_subscriber(
+                channels=[INPUT_REQUIRED, DISPLAY, END]
+            )
+            relay_thread = threading.Thread(target=self.relay_input_for_workers, args=(subscriber,))
+            relay_thread.start()
+
+            pool = self.get_worker_pool()
+            # Loop until no pending tasks remain and all in-flight tasks have finished
+            while self.scheduler.pending_tasks_exist() or self.scheduler.in_flight_tasks_exist():
+
+                # Step 1: Schedule any tasks whose dependencies are met
+                tasks_to_launch = []
+                while True:
+                    ready_task = self.scheduler.pop_ready_task()
+                    if not ready_task:
                         break
 
-                    # Avoid busy waiting
-                    if not ready_task and not newly_finished_tasks:
-                        time.sleep(self.config.task_waiting_time_in_sec)
+                    # Only try to replan for those tasks having dependencies
+                    if ready_task["dependencies"]:
+                        task_name = ready_task["name"]
+                        self.scheduler.mark_replanning(task_name)
+                        future = replan_executor.submit(
+                            self.planner.replan,
+                            query=query,
+                            pending_task=ready_task
+                        )
+                        # Bound now, as a replan may finish after an aborted query, once the next began
+                        scheduler = self.scheduler
+                        future.add_done_callback(
+                            lambda f, name=task_name: scheduler.notify_replanned(name, f)
+                        )
+                    else:
+                        tasks_to_launch.append(ready_task)
+                if not self.launch_tasks(pool, query, tasks_to_launch, async_results):
+                    break
+
+                if not self.scheduler.in_flight_tasks_exist():
+                    if self.scheduler.pending_tasks_exist():
+                        # Nothing is in flight and nothing is ready, so no event can ever unblock them
+                        logging.error(f"Tasks {sorted(self.scheduler.pending_task_names)} "
+                                      f"can never be ready as their dependencies "
+                                      f"cannot be met. Aborting...")
+                    break
+
+                # Step 2: Block until running tasks complete or replans return, rather than polling them
+                tasks_to_launch = []
+                for event_type, task_name, future in self.scheduler.wait_for_events():
+                    if event_type == DagScheduler.REPLAN_FINISHED:
+                        tasks_to_launch += self.apply_replan(task_name, future)
                         continue
 
+                    try:
+                        self.propagate_exception(task_name, async_results)
+                    except Exception as e:  # TODO: if necessary, deal with it
+                        logging.error(f"Task {task_name} not finished due to {e}\n"
+                                      f"{traceback.format_exc()}")
+                    del async_results[task_name]
+                    self.scheduler.mark_completed(task_name)
+                if not self.launch_tasks(pool, query, tasks_to_launch, async_results):
+                    break
+
         except Exception as e:
             print(f"Failed to serve query due to {e}")
             print(traceback.format_exc())
         finally:
+            replan_executor.shutdown(wait=False, cancel_futures=True)
+            if self.scheduler.running_tasks_exist():
+                # Do not let an aborted query keep occupying the warm workers
+                self.terminate_worker_pool()
+
             # to notify other threads to stop
             self.environment.publish_a_message(channel=END, message="done")
-
-            # only need to do this when usnig owl's tools through mcp
-            cmd = "ps aux | grep python | grep server.py | grep -v grep | awk '{print $2}' | xargs kill -9"
-            try:
-                subprocess.run(cmd, shell=True, check=True)
-                print("Kill command executed successfully.")
-            except subprocess.CalledProcessError as e:
-                print(f"Error executing kill command: {e}")
+            if relay_thread is not None:
+                relay_thread.join(timeout=self.INPUT_TIMEOUT)  # flush what workers displayed
 
         end_time = time.perf_counter()
         duration = end_time - start_time
@@ -2,7 +2,7 @@ import json
 import logging
 import traceback
 
-from hey.agents.basic.prompt import critic_prompt_dict as new_critic_prompt_dict
+from hey.agents.basic.prompt import get_prompt_dicts
 from hey.backend.llm.registry import get_llm
 from hey.utils.misc import extract_json_from_string
 
@@ -12,7 +12,7 @@ class BasicCritic():
         self.config = config
         self.environment = environment
         self.llm = get_llm(config.llm)
-        self.new_prompt_dict = new_critic_prompt_dict
+        _, self.new_prompt_dict = get_prompt_dicts(config.prompt_layout)
 
     def evaluate_execution(self, overall_task, task):
         task_name = task["name"]
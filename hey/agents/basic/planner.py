@@ -1,7 +1,7 @@
 import json
 import logging
 from hey.mcp_tools.sync_client import get_mcp_client
-from hey.agents.basic.prompt import planner_prompt_dict as new_planner_prompt_dict
+from hey.agents.basic.prompt import get_prompt_dicts
 from hey.backend.llm.registry import get_llm
 from hey.utils.misc import extract_json_from_string
 
@@ -9,12 +9,44 @@ from hey.utils.misc import extract_json_from_string
 class BasicPlanner():
     def __init__(self, config, environment, mcp_server_script_file=None):
         self.config = config
-        self.new_prompt_dict = new_planner_prompt_dict
+        self.new_prompt_dict, _ = get_prompt_dicts(config.prompt_layout)
         self.environment = environment
         self.llm = get_llm(config.llm)
         self.task_name_history = set()
         self.print_tag = "[Planning]"
         self.mcp_server_script_file = mcp_server_script_file
+        # Rendered system prompts keyed by (prompt name, tool catalog version)
+        self.system_prompt_cache = {}
+
+    def warm_up(self):
+        get_mcp_client(
+            log_path=self.environment.get_log_path(),
+            server_script_file=self.mcp_server_script_file
+        )
+
+    def get_system_prompt(self, prompt_name):
+        mcp_client = get_mcp_client(
+            log_path=self.environment.get_log_path(),
+            server_script_file=self.mcp_server_script_file
+        )
+        version, tools = mcp_client.get_tool_catalog()
+        cache_key = (prompt_name, version)
+        if cache_key not in self.system_prompt_cache:
+            new_tools = []
+            for tool in tools:  # useful for smooth benchmarking
+                if self.config.disable_asking and tool["name"] == "ask_user":
+                    continue
+                new_tools.append(tool)
+            # format method cannot be used here
+            system_prompt = self.new_prompt_dict[prompt_name].replace(
+                '{tool_list}', json.dumps(new_tools, indent=4)
+            )
+            self.system_prompt_cache = {
+                key: value for key, value in self.system_prompt_cache.items()
+                if key[1] == version  # drop prompts of outdated catalogs
+            }
+            self.system_prompt_cache[cache_key] = system_prompt
+        return self.system_prompt_cache[cache_key]
 
     def display_plan(self, task_list):
         task_names = [task["name"] for task in task_list]
@@ -24,21 +56,7 @@ class BasicPlanner():
     def plan(self, query):
         logging.info(f"Starting to plan")
         log_path = self.environment.get_log_path()
-
-        mcp_client = get_mcp_client(
-            log_path=log_path,
-            server_script_file=self.mcp_server_script_file
-        )
-        tools = mcp_client.list_tools()
-        new_tools = []
-        for tool in tools:  # useful for smooth benchmarking
-            if self.config.disable_asking and tool["name"] == "ask_user":
-                continue
-            new_tools.append(tool)
-        # format method cannot be used here
-        system_prompt = self.new_prompt_dict['plan_system_prompt'].replace(
-            '{tool_list}', json.dumps(new_tools, indent=4)
-        )
+        system_prompt = self.get_system_prompt('plan_system_prompt')
 
         user_query = self.new_prompt_dict['plan_user_query'].format(
             query=query,
@@ -69,20 +87,7 @@ class BasicPlanner():
         pending_task_name = pending_task["name"]
         dependency_states = self.environment.get_task_states(pending_task['dependencies'])
         log_path = self.environment.get_log_path()
-
-        mcp_client = get_mcp_client(
-            log_path=log_path,
-            server_script_file=self.mcp_server_script_file
-        )
-        tools = mcp_client.list_tools()
-        new_tools = []
-        for tool in tools:  # useful for smooth benchmarking
-            if self.config.disable_asking and tool["name"] == "ask_user":
-                continue
-            new_tools.append(tool)
-        system_prompt = self.new_prompt_dict['replan_system_prompt'].replace(
-            '{tool_list}', json.dumps(new_tools, indent=4)
-        )
+        system_prompt = self.get_system_prompt('replan_system_prompt')
 
         user_query = self.new_prompt_dict['replan_user_query'].format(
             query=query,
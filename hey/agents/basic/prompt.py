@@ -255,3 +255,62 @@ Previous Execution Result: {execution_result}
 Comment: {comment}
 """,
 }
+
+# Same prompts with the user queries reordered so that everything that stays fixed
+# within a query (and often across queries) comes first and volatile context comes last.
+# Together with the system prompt, this gives repeated replans and critiques
+# a byte-identical prefix that providers can serve from their prompt caches.
+prefix_stable_planner_prompt_dict = dict(planner_prompt_dict, **{
+    'plan_user_query':
+"""
+Operating System: {os_name}
+Current Working Directory: {working_dir}
+Log Path: {log_path}
+Overall Task: {query}
+Files and Folders in Current Working Directiory: {files_and_folders}
+""",
+
+    'replan_user_query':
+"""
+Operating System: {os_name}
+Current Working Directory: {working_dir}
+Log Path: {log_path}
+Overall Task: {query}
+Files and Folders in Current Working Directiory: {files_and_folders}
+Results of Dependent Subtasks: {dependency_states}
+Current Subtask: {current_subtask}
+"""
+})
+
+prefix_stable_critic_prompt_dict = dict(critic_prompt_dict, **{
+    'evaluate_user_query':
+"""
+Operating System: {os_name}
+Current Working Directory: {working_dir}
+Overall Task Description: {overall_task}
+Dependent Tasks and States: {dependencies_states}
+Current Subtask Description: {task_description}
+Execution Result: {execution_result}
+""",
+
+    'arguments_amend_user_query':
+"""
+Operating System: {os_name}
+Current Working Directory: {working_dir}
+Overall Task Description: {overall_task}
+Dependent Tasks and States: {dependencies_states}
+Current Subtask: {current_task}
+Previous Execution Result: {execution_result}
+Comment: {comment}
+""",
+})
+
+
+def get_prompt_dicts(prompt_layout):
+    """Return (planner prompts, critic prompts) for a layout named in config.yml."""
+    if prompt_layout == "prefix_stable":
+        return prefix_stable_planner_prompt_dict, prefix_stable_critic_prompt_dict
+    elif prompt_layout in (None, "classic"):
+        return planner_prompt_dict, critic_prompt_dict
+    else:
+        raise NotImplementedError(f"Unknown prompt layout {prompt_layout}")
@@ -0,0 +1,142 @@
+import queue
+from collections import deque, defaultdict
+
+
+class DagScheduler():
+    """Bookkeeping for the subtask DAG of a single query.
+
+    Every task carries a counter of its unfinished dependencies. Finishing a
+    task only touches its own successors, so readiness is updated in O(out-degree)
+    and the main loop never has to rescan the pending tasks. Completion events
+    are pushed from the pool's result-handler thread through `notify_finished`,
+    and replanning results from the replan executor through `notify_replanned`,
+    which lets the main loop block instead of polling.
+    """
+    TASK_FINISHED = "task_finished"
+    REPLAN_FINISHED = "replan_finished"
+
+    def __init__(self):
+        self.tasks = {}
+        self.num_unmet_dependencies = {}
+        self.successors = defaultdict(set)
+
+        self.completed_task_names = set()
+        self.running_task_names = set()
+        self.replanning_task_names = set()
+        self.pending_task_names = set()
+
+        self.ready_tasks = deque()
+        self.events = queue.Queue()
+
+    def _count_unmet_dependencies(self, task):
+        return sum(1 for dep in set(task['dependencies'])
+                   if dep not in self.completed_task_names)
+
+    def add_tasks(self, task_list, enqueue=True):
+        """Register tasks and return those that are immediately ready.
+
+        With `enqueue=False` the ready ones are handed back to the caller
+        only, which then launches them directly (e.g., to avoid replanning).
+        """
+        ready_tasks = []
+        for task in task_list:
+            task_name = task["name"]
+            self.tasks[task_name] = task
+            self.pending_task_names.add(task_name)
+            for dep in task['dependencies']:
+                self.successors[dep].add(task_name)
+
+            num_unmet = self._count_unmet_dependencies(task)
+            self.num_unmet_dependencies[task_name] = num_unmet
+            if num_unmet == 0:
+                ready_tasks.append(task)
+
+        if enqueue:
+            self.ready_tasks.extend(task["name"] for task in ready_tasks)
+        return ready_tasks
+
+    def remove_task(self, task_name):
+        """Drop a not-yet-completed task and return the names of its successors."""
+        task = self.tasks.pop(task_name)
+        self.pending_task_names.discard(task_name)
+        self.replanning_task_names.discard(task_name)
+        self.num_unmet_dependencies.pop(task_name, None)
+        for dep in task['dependencies']:
+            self.successors[dep].discard(task_name)
+        return [name for name in self.successors.pop(task_name, set())
+                if name in self.tasks]
+
+    def replace_dependency(self, task_name, old_dependency, new_dependencies):
+        task = self.tasks[task_name]
+        task['dependencies'].remove(old_dependency)
+        task['dependencies'] += new_dependencies
+        for dep in new_dependencies:
+            self.successors[dep].add(task_name)
+        self.num_unmet_dependencies[task_name] = self._count_unmet_dependencies(task)
+        # e.g., replaced by no task at all, which leaves nothing to wait for
+        if self.num_unmet_dependencies[task_name] == 0 and task_name in self.pending_task_names:
+            self.ready_tasks.append(task_name)
+
+    def pop_ready_task(self):
+        while self.ready_tasks:
+            task_name = self.ready_tasks.popleft()
+            # Tasks may have been removed or launched since they were enqueued
+            if (task_name in self.pending_task_names
+                    and self.num_unmet_dependencies.get(task_name) == 0):
+                return self.tasks[task_name]
+        return None
+
+    def mark_replanning(self, task_name):
+        self.pending_task_names.discard(task_name)
+        self.replanning_task_names.add(task_name)
+
+    def mark_running(self, task_name):
+        self.pending_task_names.discard(task_name)
+        self.replanning_task_names.discard(task_name)
+        self.running_task_names.add(task_name)
+
+    def mark_completed(self, task_name):
+        # even originally pending task needs to be marked as completed
+        self.running_task_names.discard(task_name)
+        self.replanning_task_names.discard(task_name)
+        self.pending_task_names.discard(task_name)
+        if task_name in self.completed_task_names:
+            return
+        self.completed_task_names.add(task_name)
+
+        for successor in self.successors.get(task_name, ()):
+            if successor not in self.pending_task_names:
+                continue
+            self.num_unmet_dependencies[successor] -= 1
+            if self.num_unmet_dependencies[successor] == 0:
+                self.ready_tasks.append(successor)
+
+    def pending_tasks_exist(self):
+        return len(self.pending_task_names) > 0
+
+    def running_tasks_exist(self):
+        return len(self.running_task_names) > 0
+
+    def replanning_tasks_exist(self):
+        return len(self.replanning_task_names) > 0
+
+    def in_flight_tasks_exist(self):
+        return self.running_tasks_exist() or self.replanning_tasks_exist()
+
+    def notify_finished(self, task_name):
+        """Thread-safe; called from the pool's callback thread."""
+        self.events.put((self.TASK_FINISHED, task_name, None))
+
+    def notify_replanned(self, task_name, future):
+        """Thread-safe; called when the replanning future of a task is done."""
+        self.events.put((self.REPLAN_FINISHED, task_name, future))
+
+    def wait_for_events(self):
+        """Block until at least one event arrives, then drain what is queued."""
+        events = [self.events.get()]
+        while True:
+            try:
+                events.append(self.events.get_nowait())
+            except queue.Empty:
+                break
+        return events
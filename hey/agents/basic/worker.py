@@ -0,0 +1,46 @@
+import os
+import dotenv
+import logging
+import multiprocessing as mp
+from multiprocessing.util import Finalize
+
+from hey.utils.misc import set_log
+from hey.agents.basic.const import WARM_UP_KERNELS_ENV_VAR
+from hey.mcp_tools.sync_client import get_mcp_client, close_mcp_client
+
+_worker_log_path = None
+
+
+def prepare_worker(log_path):
+    """Point the worker's logging at `log_path`, which may change between queries."""
+    global _worker_log_path
+    if log_path != _worker_log_path:
+        set_log(log_path=log_path)
+        _worker_log_path = log_path
+
+
+def init_worker(log_path, server_script_file):  # runs once per worker process
+    dotenv.load_dotenv(dotenv_path='.env', override=True)
+    prepare_worker(log_path)
+
+    # Starting the MCP server (and the toolkits it imports) is the dominant
+    # cold-start cost, so it is paid here rather than by the first task
+    os.environ[WARM_UP_KERNELS_ENV_VAR] = "1"  # inherited by the server
+    get_mcp_client(
+        log_path=log_path,
+        server_script_file=server_script_file
+    )
+    logging.info(f"Worker is warmed up")
+
+    # Pool workers skip atexit handlers but do run finalizers on a normal exit,
+    # e.g., when recycled after `maxtasksperchild` tasks or when the pool is closed
+    Finalize(None, close_mcp_client, exitpriority=10)
+
+
+def create_worker_pool(config, log_path):
+    return mp.get_context("spawn").Pool(
+        processes=config.max_workers,
+        initializer=init_worker,
+        initargs=(log_path, config.mcp_server_script_file),
+        maxtasksperchild=config.worker_max_tasks  # None means never recycling
+    )
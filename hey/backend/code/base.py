@@ -1,6 +1,11 @@
+import os
+import re
+import logging
+import platform
 from munch import DefaultMunch
 from abc import abstractmethod, ABCMeta
 
+from hey.utils.cache import DiskCache
 from hey.backend.llm.registry import get_llm
 
 
@@ -16,8 +21,29 @@ def extract_code_from_string(text, code_type):
     return code.strip('\n ')
 
 
+def normalize_goal(goal):
+    # Case is kept, as goals hold paths, identifiers and strings to print
+    return re.sub(r'\s+', ' ', goal).strip().rstrip('.!?')
+
+
+def jaccard_similarity(a, b):
+    return len(a & b) / len(a | b) if a or b else 1.0
+
+
 class Basic(metaclass=ABCMeta):
-    def __init__(self):
+    """Generating code for a goal and executing it.
+
+    With a `cache_dir`, code that executed successfully is cached by the
+    normalized goal, OS, code type and model, so that repeating a goal skips
+    the LLM. Code that fails is evicted, as is code whose result is judged
+    wrong later on, see `forget_code`. With `CODE_CACHE_SIMILARITY_THRESHOLD`
+    above 0, the cache also serves goals whose words are that similar (Jaccard)
+    to those of a cached goal.
+    """
+    CODE_TYPE = None
+    CODE_CACHE_INDEX_SIZE = 1000  # the most recent goals considered for similar ones
+
+    def __init__(self, cache_dir=None):
         llm_config = {
             "type": "openai",
             "api_key_type": "ark",
@@ -26,12 +52,68 @@ class Basic(metaclass=ABCMeta):
         }  # TODO: avoid hard-coding
         llm_config = DefaultMunch.fromDict(llm_config)
         self.coding_llm = get_llm(llm_config)
+        self.code_cache = None if cache_dir is None else DiskCache(cache_dir, max_size_in_bytes=64 * 1024 * 1024)
+        self.similarity_threshold = float(os.getenv("CODE_CACHE_SIMILARITY_THRESHOLD", 0))
+
+    def _cache_scope(self):
+        return [self.CODE_TYPE, platform.system(), self.coding_llm.model_name]
+
+    def _find_cached_code(self, goal):
+        key = ["code", *self._cache_scope(), goal]
+        code = self.code_cache.get(key)
+        if code is not None or self.similarity_threshold <= 0:
+            return key, code
+
+        words = set(goal.split())
+        best_goal, best_similarity = None, 0
+        for cached_goal in self.code_cache.get(["goals", *self._cache_scope()], []):
+            similarity = jaccard_similarity(words, set(cached_goal.split()))
+            if similarity > best_similarity:
+                best_goal, best_similarity = cached_goal, similarity
+        if best_goal is None or best_similarity < self.similarity_threshold:
+            return key, None
+        logging.info(f"Reusing the code for the similar goal ({best_similarity:.2f}): {best_goal}")
+        similar_key = ["code", *self._cache_scope(), best_goal]
+        code = self.code_cache.get(similar_key)
+        return (key, None) if code is None else (similar_key, code)
+
+    def _cache_code(self, key, goal, code):
+        self.code_cache.set(key, code)
+        if self.similarity_threshold > 0:
+            index_key = ["goals", *self._cache_scope()]
+            goals = [g for g in self.code_cache.get(index_key, []) if g != goal] + [goal]
+            self.code_cache.set(index_key, goals[-self.CODE_CACHE_INDEX_SIZE:])
 
     def serve(self, query):
-        code = self.generate_code(query)
+        if self.code_cache is None:
+            code = self.generate_code(query)
+            return self.execute_code(code)
+
+        goal = normalize_goal(query)
+        key, code = self._find_cached_code(goal)
+        from_cache = code is not None
+        if not from_cache:
+            code = self.generate_code(query)
         result = self.execute_code(code)
+
+        if self.is_successful(result):
+            if not from_cache:
+                self._cache_code(key, goal, code)
+        elif from_cache:
+            self.code_cache.delete(key)  # e.g., the environment changed since
         return result
 
+    def forget_code(self, query):
+        """Evict the code that serves `query`, so that it is generated anew the next time."""
+        if self.code_cache is None:
+            return
+        key, code = self._find_cached_code(normalize_goal(query))
+        if code is not None:
+            self.code_cache.delete(key)
+
+    def is_successful(self, result):
+        return True
+
     @abstractmethod
     def generate_code(self, query):
         pass
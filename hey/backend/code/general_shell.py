@@ -1,6 +1,12 @@
+import os
 import re
 import json
+import time
+import uuid
+import psutil
+import selectors
 import subprocess
+import concurrent.futures
 
 from hey.backend.code.base import Basic, extract_code_from_string
 
@@ -24,19 +30,232 @@ shell code
 ```
 """
 
+parallel_groups_prompt = """
+Separate groups of commands that are independent of each other with an empty line, so that they can run in parallel.
+"""
+
+BACKGROUND_JOB_OUTPUT = "None (Background job and we do not wait for it)."
+# What bash says of code cut short, e.g., within quotes, a heredoc or a loop
+INCOMPLETE_CODE_COMPLAINTS = ["unexpected EOF", "unexpected end of file", "delimited by end-of-file"]
+
+
+def check_syntax(code):
+    """Return what bash finds wrong with `code` without running it, or None if nothing.
+
+    A heredoc missing its delimiter is only a warning to bash, but counts as
+    wrong here, as it would swallow whatever the session sends after it.
+    """
+    checked = subprocess.run(
+        ["/bin/bash", "--noprofile", "--norc", "-n"],
+        input=code.encode("utf-8"),
+        capture_output=True,
+        env={**os.environ, "LC_ALL": "C"}  # for the complaints to be in English
+    )
+    complaint = checked.stderr.decode("utf-8", errors="replace").strip()
+    if checked.returncode != 0 or "delimited by end-of-file" in complaint:
+        return complaint or "Syntax error"
+    return None
+
+
+def split_complete(code, delimiter_pattern):
+    """Split `code` on `delimiter_pattern`, except where it would cut a command short.
+
+    Pieces are joined back, with their delimiters, to those after them for
+    as long as bash finds them incomplete, e.g., a quote not closed yet.
+    """
+    pieces = re.split(f"({delimiter_pattern})", code)
+    result = []
+    current = pieces[0]
+    for delimiter, piece in zip(pieces[1::2], pieces[2::2]):
+        complaint = check_syntax(current) if current.strip() else None
+        if complaint is not None and any(c in complaint for c in INCOMPLETE_CODE_COMPLAINTS):
+            current += delimiter + piece
+        else:
+            result.append(current)
+            current = piece
+    result.append(current)
+    return result
+
+
+class _StreamReader():
+    """Output of a command on one stream, up to the marker that the session prints after it.
+
+    Only the first and the last halves of `max_length` bytes are kept.
+    """
+
+    def __init__(self, marker, max_length):
+        self.marker = marker
+        self.half_length = max_length // 2
+        self.head = bytearray()
+        self.tail = bytearray()
+        self.num_truncated = 0
+        self.pending = b""  # possibly the start of the marker
+        self.marker_line = None
+
+    def feed(self, data):
+        self.pending += data
+        index = self.pending.find(self.marker)
+        if index >= 0:
+            if b"\n" in self.pending[index:]:
+                self._keep(self.pending[:index])
+                self.marker_line = self.pending[index:].split(b"\n", 1)[0].decode("utf-8", errors="replace")
+                self.pending = b""
+            return
+        cut = max(len(self.pending) - len(self.marker), 0)
+        self._keep(self.pending[:cut])
+        self.pending = self.pending[cut:]
+
+    def _keep(self, data):
+        head_room = self.half_length - len(self.head)
+        if head_room > 0:
+            self.head += data[:head_room]
+            data = data[head_room:]
+        self.tail += data
+        excess = len(self.tail) - self.half_length
+        if excess > 0:
+            del self.tail[:excess]
+            self.num_truncated += excess
+
+    @property
+    def done(self):
+        return self.marker_line is not None
+
+    def text(self):
+        self._keep(self.pending)  # output of a command that ended the session
+        self.pending = b""
+        text = self.head.decode("utf-8", errors="replace")
+        if self.num_truncated:
+            text += f"\n[... {self.num_truncated} bytes of output truncated ...]\n"
+        text += self.tail.decode("utf-8", errors="replace")
+        return text.strip()
+
+
+class ShellSession():
+    """A bash process that runs commands one after another, keeping the working directory and
+    environment variables in between, rather than a bash process started for every command.
+
+    Each command runs with stdin from /dev/null and is followed by markers on
+    stdout and stderr, which tell where its output ends, its exit code and
+    the working directory it left. A command that bash cannot parse is
+    rejected without being sent. A command running past its deadline is
+    killed with the session, which then restarts in the last known working
+    directory, losing only the environment variables set so far.
+    """
+    READ_SIZE_IN_BYTES = 64 * 1024
+    MAX_OUTPUT_LENGTH = 20000  # in bytes, per stream
+
+    def __init__(self, cwd=None):
+        self.cwd = cwd or os.getcwd()
+        self.process = None
+        self.start()
+
+    def start(self):
+        self.process = subprocess.Popen(
+            ["/bin/bash", "--noprofile", "--norc"],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            cwd=self.cwd
+        )
+
+    def close(self):
+        if self.process is None:
+            return
+        try:
+            processes = psutil.Process(self.process.pid).children(recursive=True)
+        except psutil.Error:
+            processes = []
+        for process in processes:
+            try:
+                process.kill()
+            except psutil.Error:
+                pass
+        self.process.kill()
+        self.process.wait()
+        for pipe in [self.process.stdin, self.process.stdout, self.process.stderr]:
+            pipe.close()
+        self.process = None
+
+    def run(self, command, timeout):
+        # Sent as is, an incomplete command would leave the session waiting for the rest until timed out
+        complaint = check_syntax(command)
+        if complaint is not None:
+            return {"stdout": "", "stderr": complaint, "exit_code": 2}
+
+        if self.process is None:
+            self.start()
+        marker = f"__HEY_{uuid.uuid4().hex}__"
+        background = command.split()[-1] == "&"
+        if background:
+            # Detached from the session, so that it neither writes to the session nor gets killed with it
+            script = f"( ( {command[:-1].rstrip()} ) > /dev/null 2>&1 < /dev/null & )\n"
+        else:
+            script = f"{{ {command}\n}} < /dev/null\n"
+        script += f"printf '\\n%s %s %s\\n' {marker} \"$?\" \"$PWD\"\n" \
+                  f"printf '\\n%s\\n' {marker} >&2\n"
+
+        readers = {
+            self.process.stdout: _StreamReader(marker.encode(), self.MAX_OUTPUT_LENGTH),
+            self.process.stderr: _StreamReader(marker.encode(), self.MAX_OUTPUT_LENGTH)
+        }
+        exit_code = None
+        timed_out = False
+        try:
+            self.process.stdin.write(script.encode("utf-8"))
+            self.process.stdin.flush()
+        except BrokenPipeError:  # the session was ended by the previous command
+            self.close()
+            return self.run(command, timeout)
+
+        deadline = time.monotonic() + timeout
+        with selectors.DefaultSelector() as selector:
+            for pipe in readers:
+                selector.register(pipe, selectors.EVENT_READ)
+            while selector.get_map():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    timed_out = True
+                    break
+                for key, _ in selector.select(timeout=remaining):
+                    data = os.read(key.fileobj.fileno(), self.READ_SIZE_IN_BYTES)
+                    reader = readers[key.fileobj]
+                    if data:
+                        reader.feed(data)
+                    if not data or reader.done:
+                        selector.unregister(key.fileobj)
+
+        stdout_reader, stderr_reader = readers[self.process.stdout], readers[self.process.stderr]
+        if stdout_reader.done:
+            _, exit_code, self.cwd = stdout_reader.marker_line.split(" ", 2)
+            exit_code = int(exit_code)
+        if not (stdout_reader.done and stderr_reader.done):  # timed out, or ended the session, e.g., by exit
+            if exit_code is None and not timed_out:
+                exit_code = self.process.wait()
+            self.close()
+
+        stdout, stderr = stdout_reader.text(), stderr_reader.text()
+        if timed_out:
+            stderr += f"\nTimed out after {timeout} seconds, and killed."
+        if background:
+            stdout = stderr = BACKGROUND_JOB_OUTPUT
+        return {"stdout": stdout, "stderr": stderr.strip(), "exit_code": exit_code}
+
 
 class Shell(Basic):
-    def __init__(self):
-        super().__init__()
+    CODE_TYPE = "shell"
+
+    def __init__(self, parallel_groups=None, cache_dir=None):
+        super().__init__(cache_dir=cache_dir)
+        if parallel_groups is None:
+            parallel_groups = os.getenv("SHELL_PARALLEL_GROUPS", "0") == "1"
+        self.parallel_groups = parallel_groups
+        self.command_timeout = float(os.getenv("SHELL_COMMAND_TIMEOUT_IN_SEC", 600))
+
 
     @staticmethod
     def parse_commands(code):
-        # Remove escaped newlines (i.e., "\n" preceded by a backslash)
-        code = re.sub(r'\\\n', ' ESCAPED_NEWLINE ', code)
-        # Split by semicolons and newlines (handle both '\n' and ';' delimiters)
-        commands = re.split(r'(?<!\\)[;\n]', code)
-        # Restore the escaped newlines
-        commands = [cmd.replace(' ESCAPED_NEWLINE ', '\\n') for cmd in commands]
+        # Split by semicolons and newlines not escaped, nor within quotes, heredocs, loops, etc.
+        commands = split_complete(code, r'(?<!\\)[;\n]')
 
         # Strip leading/trailing spaces for each command
         # any pay attention to the combination of && and &
@@ -60,48 +279,29 @@ class Shell(Basic):
         commands = self.parse_commands(code)
 
         result = []
-        for command in commands:
-            result.append({
-                'command': command,
-                'stdout': "",
-                'stderr': "",
-            })
-            if command.split()[-1] == "&":
-                background = True
-                # Do not use in subprocess.PIPE, otherwise, the background process will exit as the main process exits
-                # which may not be desirable
-                # The possible choice is subprocess.DEVNULL or None (print to the terminal)
-                # TODO: Current choice is subprocess.DEVNULL, can evaluate the issue if any
-                process = subprocess.Popen(command,
-                                           shell=True,
-                                           stdout=subprocess.DEVNULL,
-                                           stderr=subprocess.DEVNULL,
-                                           executable="/bin/bash")
-            else:
-                background = False
-                process = subprocess.Popen(command,
-                                           shell=True,
-                                           stdout=subprocess.PIPE,
-                                           stderr=subprocess.PIPE,
-                                           executable="/bin/bash")
-
-            # Only wait for foreground process, otherwise the next command will be blocked
-            if not background:
-                stdout = process.communicate()[0].strip().decode("utf-8")
-                stderr = process.communicate()[1].strip().decode("utf-8")
-            else:
-                stdout = "None (Background job and we do not wait for it)."
-                stderr = "None (Background job and we do not wait for it)."
-
-            result[-1].update({
-                'stdout': stdout,
-                'stderr': stderr,
-            })
+        session = ShellSession()
+        try:
+            for command in commands:
+                result.append({'command': command, **session.run(command, timeout=self.command_timeout)})
+        finally:
+            session.close()
 
         return result
 
+    def run_group_by_group(self, code):
+        # Groups are separated by empty lines
+        groups = [group for group in split_complete(code, r'\n\s*\n') if group.strip()]
+        if len(groups) <= 1:
+            return self.run_command_by_command(code)
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=len(groups)) as executor:
+            results = executor.map(self.run_command_by_command, groups)
+        return [command_result for group_result in results for command_result in group_result]
+
     def generate_code(self, query):
         system_prompt = code_generation_system_prompt
+        if self.parallel_groups:
+            system_prompt += parallel_groups_prompt
         user_query = query
         response = self.coding_llm.get_response(
             system_prompt=system_prompt,
@@ -111,5 +311,11 @@ class Shell(Basic):
         return code
 
     def execute_code(self, code):
-        result = self.run_command_by_command(code=code)
+        if self.parallel_groups:
+            result = self.run_group_by_group(code=code)
+        else:
+            result = self.run_command_by_command(code=code)
         return json.dumps(result)  # important!
+
+    def is_successful(self, result):
+        return all(command_result['exit_code'] == 0 for command_result in json.loads(result))
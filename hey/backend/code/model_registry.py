@@ -0,0 +1,89 @@
+import gc
+import os
+import time
+import logging
+import threading
+from contextlib import contextmanager
+
+
+def _load_whisper():
+    import whisper
+    return whisper.load_model(os.getenv("WHISPER_MODEL_NAME", "base"))
+
+
+def _load_cnocr():
+    from cnocr import CnOcr
+    kwargs = {}
+    if os.getenv("CNOCR_DET_MODEL_NAME"):
+        kwargs["det_model_name"] = os.getenv("CNOCR_DET_MODEL_NAME")
+    if os.getenv("CNOCR_REC_MODEL_NAME"):
+        kwargs["rec_model_name"] = os.getenv("CNOCR_REC_MODEL_NAME")
+    return CnOcr(**kwargs)
+
+
+class ModelRegistry():
+    """Models loaded at most once per process, on first use.
+
+    A model is used under its own lock, which serializes inference from
+    concurrent threads and keeps it from being evicted while in use. Models
+    left idle for `MODEL_IDLE_TIMEOUT_IN_SEC` (0 to disable) are dropped to
+    free memory and reloaded on their next use.
+    """
+    EVICTION_CHECK_INTERVAL_IN_SEC = 60
+
+    def __init__(self):
+        self._loaders = {}
+        self._models = {}
+        self._last_used = {}
+        self._locks = {}
+        self._evictor = None
+        self._evictor_lock = threading.Lock()
+
+    def register(self, name, loader):
+        self._loaders[name] = loader
+        self._locks[name] = threading.Lock()
+
+    @staticmethod
+    def _idle_timeout():
+        return float(os.getenv("MODEL_IDLE_TIMEOUT_IN_SEC", 1800))
+
+    @contextmanager
+    def use(self, name):
+        with self._locks[name]:
+            model = self._models.get(name)
+            if model is None:
+                start_time = time.perf_counter()
+                model = self._loaders[name]()
+                self._models[name] = model
+                logging.info(f"Loaded model {name} in {time.perf_counter() - start_time:.1f}s")
+                self._start_evictor()
+            try:
+                yield model
+            finally:
+                self._last_used[name] = time.monotonic()
+
+    def _start_evictor(self):
+        with self._evictor_lock:
+            if self._evictor is None and self._idle_timeout() > 0:
+                self._evictor = threading.Thread(target=self._evict_idle_models, daemon=True)
+                self._evictor.start()
+
+    def _evict_idle_models(self):
+        while True:
+            time.sleep(self.EVICTION_CHECK_INTERVAL_IN_SEC)
+            for name, lock in self._locks.items():
+                if not lock.acquire(blocking=False):  # in use
+                    continue
+                try:
+                    idle_time = time.monotonic() - self._last_used.get(name, time.monotonic())
+                    if name in self._models and idle_time > self._idle_timeout():
+                        del self._models[name]
+                        gc.collect()
+                        logging.info(f"Evicted model {name} after {idle_time:.0f}s of idleness")
+                finally:
+                    lock.release()
+
+
+model_registry = ModelRegistry()
+model_registry.register("whisper", _load_whisper)
+model_registry.register("cnocr", _load_cnocr)
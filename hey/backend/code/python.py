@@ -1,10 +1,12 @@
 import os
 import re
 import sys
-import time
 import queue
+import atexit
+import psutil
 import logging
 import traceback
+import collections
 import threading
 from jupyter_client import KernelManager
 
@@ -43,101 +45,297 @@ def setup_jupyter_logging():
         logger.addFilter(filter_instance)
 
 
-class JupyterPython():
+class PooledKernel():
+    """An IPython kernel that runs code for one task at a time, and is reset in between."""
+    READY_TIMEOUT_IN_SEC = 60
+    # Run silently on the kernel, so these neither print nor enter the history
+    # Once warm, what %reset leaves alone is recorded in a module, which survives resets
+    SNAPSHOT_CODE = """import os as _os, sys as _sys, types as _types
+_baseline = _types.ModuleType("_pooled_kernel_baseline")
+_sys.modules[_baseline.__name__] = _baseline
+_baseline.environ, _baseline.path = dict(_os.environ), list(_sys.path)
+_baseline.functions = {  # but the user namespace, cleared by %reset, and hooks the kernel sets for every request
+    name: {
+        key: value for key, value in list(getattr(module, "__dict__", {}).items())
+        if callable(value) and f"{name}.{key}" not in {"sys.excepthook", "builtins.input", "getpass.getpass"}
+    } if name != "__main__" else {}
+    for name, module in list(_sys.modules.items())
+}
+del _os, _sys, _types, _baseline"""
+    # The environment and import path are restored, but modules cannot be unloaded,
+    # so the reset fails, and the kernel is retired, if any was imported or patched
+    RESET_CODE = """import os as _os, sys as _sys
+_baseline = _sys.modules["_pooled_kernel_baseline"]
+_os.environ.clear()
+_os.environ.update(_baseline.environ)
+_sys.path[:] = _baseline.path
+if set(_sys.modules) != set(_baseline.functions) or any(
+    getattr(_sys.modules[name], "__dict__", {}).get(key) is not value
+    for name, functions in _baseline.functions.items() for key, value in functions.items()
+):
+    raise RuntimeError("Modules were imported or patched since the kernel started")
+del _os, _sys, _baseline
+get_ipython().run_line_magic("reset", "-f")
+import gc as _gc
+_gc.collect()
+del _gc"""
+    CHDIR_CODE = 'import os as _os\n_os.chdir({cwd!r})\ndel _os'
+
+    def __init__(self, preloaded_modules=()):
+        setup_jupyter_logging()
+        self.env = os.environ.copy()
+        self.km = KernelManager(
+            kernel_name='python3',
+            kernel_cmd=[sys.executable, '-m', 'ipykernel_launcher', '-f', '{connection_file}']
+        )
+        self.km.start_kernel(env=self.env)
+        self.kc = self.km.client()
+        self.kc.start_channels()
+        try:
+            self.kc.wait_for_ready(timeout=self.READY_TIMEOUT_IN_SEC)
+            if preloaded_modules:  # imported once, so that importing them again in tasks is instant
+                self.execute_silently(f"import {', '.join(preloaded_modules)}")
+            self.execute_silently(self.SNAPSHOT_CODE)
+            self.reset()
+        except Exception:
+            self.shutdown()
+            raise
+        self.num_runs = 0
+        self.base_rss_in_bytes = self.rss_in_bytes()
+
+    def execute_silently(self, code):
+        reply = self.kc.execute_interactive(
+            code,
+            silent=True,
+            store_history=False,
+            timeout=self.READY_TIMEOUT_IN_SEC,
+            output_hook=lambda msg: None  # not to print on the stdout of the server
+        )
+        if reply["content"]["status"] != "ok":
+            raise RuntimeError(f"Failed to run {code!r} on the kernel: {reply['content'].get('evalue')}")
+
+    def rss_in_bytes(self):
+        pid = getattr(self.km.provisioner, "pid", None)
+        try:
+            return psutil.Process(pid).memory_info().rss if pid else 0
+        except psutil.Error:
+            return 0
+
+    def reset(self):
+        self.execute_silently(self.RESET_CODE)
+
+    def chdir(self, cwd):
+        self.execute_silently(self.CHDIR_CODE.format(cwd=cwd))
+
+    def is_reusable(self, max_runs, max_rss_growth_in_bytes):
+        if self.num_runs >= max_runs or not self.km.is_alive():
+            return False
+        if self.env != dict(os.environ):  # e.g., .env reloaded with new keys
+            return False
+        return self.rss_in_bytes() - self.base_rss_in_bytes <= max_rss_growth_in_bytes
+
+    def shutdown(self):
+        try:
+            self.kc.stop_channels()
+            self.km.shutdown_kernel(now=True)
+        except Exception as e:
+            logging.debug(f"Failed to shut down a kernel cleanly due to {e}")
+
+
+class KernelPool():
+    """Pre-warmed kernels handed out to tasks, so that no task waits for a kernel to start.
+
+    Once given back, a kernel is reset and returned to the pool, unless a
+    module was imported (other than those preloaded) or patched in it, or it
+    has run `PYTHON_KERNEL_MAX_RUNS` tasks or grown by
+    `PYTHON_KERNEL_MAX_RSS_GROWTH_IN_MB` since it started, in which case it is
+    shut down and replaced in the background. Tasks beyond the pool size get
+    kernels started on demand, which are not kept.
+    """
+
     def __init__(self):
-        self.finish_flag = False
+        self._idle_kernels = queue.Queue()
+        self._num_starting = 0
+        self._num_in_use = 0
+        self._lock = threading.Lock()
 
-    def iopub_message_listener(self, message_queue, km, kc):
-        while True:
-            if self.finish_flag:
-                km.interrupt_kernel()
-                return
+    @staticmethod
+    def _size():
+        return int(os.getenv("PYTHON_KERNEL_POOL_SIZE", 2))
+
+    @staticmethod
+    def _preloaded_modules():
+        modules = os.getenv("PYTHON_KERNEL_PRELOADED_MODULES", "")
+        return tuple(module.strip() for module in modules.split(",") if module.strip())
+
+    def _is_reusable(self, kernel):
+        return kernel.is_reusable(
+            max_runs=int(os.getenv("PYTHON_KERNEL_MAX_RUNS", 20)),
+            max_rss_growth_in_bytes=float(os.getenv("PYTHON_KERNEL_MAX_RSS_GROWTH_IN_MB", 1024)) * 1024 * 1024
+        )
+
+    def warm_up(self):
+        with self._lock:
+            num_kernels = self._idle_kernels.qsize() + self._num_starting + self._num_in_use
+            num_missing = max(self._size() - num_kernels, 0)
+            self._num_starting += num_missing
+        for _ in range(num_missing):
+            threading.Thread(target=self._start_a_kernel, daemon=True).start()
+
+    def _start_a_kernel(self):
+        try:
+            self._idle_kernels.put(PooledKernel(self._preloaded_modules()))
+        except Exception as e:
+            logging.warning(f"Failed to start a kernel for the pool due to {e}")
+        finally:
+            with self._lock:
+                self._num_starting -= 1
+
+    def acquire(self, cwd):
+        kernel = None
+        while kernel is None:
             try:
-                msg = kc.iopub_channel.get_msg(timeout=0.05)
+                kernel = self._idle_kernels.get_nowait()
             except queue.Empty:
-                continue
+                break
+            if not self._is_reusable(kernel):
+                kernel.shutdown()
+                kernel = None
+        with self._lock:
+            self._num_in_use += 1
 
-            if (msg["header"]["msg_type"] == "status" and
-                    msg["content"]["execution_state"] == "idle"):
-                self.finish_flag = True
-                return
+        try:
+            if kernel is None:  # none is ready
+                self.warm_up()  # replacing those shut down, if any
+                kernel = PooledKernel(self._preloaded_modules())
+            kernel.chdir(cwd)
+        except Exception:
+            if kernel is not None:
+                kernel.shutdown()
+            with self._lock:
+                self._num_in_use -= 1
+            raise
+        return kernel
 
-            content = msg["content"]
-            if msg["msg_type"] == "stream":
-                line = content["text"]
-                message_queue.put(
-                    {"type": "console", "format": "output", "content": line}
-                )
-            elif msg["msg_type"] == "error":
-                content = "\n".join(content["traceback"])
-                # Remove color codes
-                ansi_escape = re.compile(r"\x1B\[[0-?]*[ -/]*[@-~]")
-                content = ansi_escape.sub("", content)
-                message_queue.put({
-                    "type": "console",
-                    "format": "output",
-                    "content": content,
-                })
+    def release(self, kernel):
+        # Off the critical path of the task that used it
+        threading.Thread(target=self._reset_or_retire, args=(kernel,), daemon=True).start()
 
-    def _run_code(self, code, km, kc):
-        self.finish_flag = False
+    def _reset_or_retire(self, kernel):
+        kernel.num_runs += 1
+        with self._lock:
+            is_needed = self._idle_kernels.qsize() + self._num_starting + self._num_in_use <= self._size()
         try:
-            message_queue = queue.Queue()
-            listener_thread = threading.Thread(
-                target=self.iopub_message_listener, args=(message_queue, km, kc)
-            )
-            listener_thread.start()
+            if is_needed and self._is_reusable(kernel):
+                try:
+                    kernel.reset()
+                    self._idle_kernels.put(kernel)
+                    return
+                except Exception as e:
+                    logging.info(f"Failed to reset a kernel due to {e}")
+            kernel.shutdown()
+        finally:
+            with self._lock:
+                self._num_in_use -= 1
+        if is_needed:
+            self.warm_up()
+
+    def shutdown(self):
+        while True:
+            try:
+                self._idle_kernels.get_nowait().shutdown()
+            except queue.Empty:
+                return
+
+
+kernel_pool = KernelPool()
+atexit.register(kernel_pool.shutdown)
 
-            kc.execute(code)
 
+ANSI_ESCAPE = re.compile(r"\x1B\[[0-?]*[ -/]*[@-~]")
+
+
+class JupyterPython():
+    MAX_OUTPUT_LENGTH = 20000  # in characters, half from the start and half from the end
+    LIVENESS_CHECK_INTERVAL_IN_SEC = 1
+
+    def _run_code(self, code, km, kc):
+        """Yield the output of `code` as it arrives, until the kernel goes idle.
+
+        Once the output exceeds half of `MAX_OUTPUT_LENGTH`, only its end is
+        kept, so chatty programs neither flood the result nor stall the kernel.
+        """
+        head_budget = self.MAX_OUTPUT_LENGTH // 2
+        tail, tail_length = collections.deque(), 0
+        num_truncated = 0
+        try:
+            msg_id = kc.execute(code)
             while True:
                 try:
-                    output = message_queue.get(timeout=0.1)
-                    yield output
+                    msg = kc.get_iopub_msg(timeout=self.LIVENESS_CHECK_INTERVAL_IN_SEC)
                 except queue.Empty:
-                    if self.finish_flag:
-                        break
-                time.sleep(0.1)
+                    if not km.is_alive():
+                        raise RuntimeError("The kernel died while running the code")
+                    continue
+                if msg["parent_header"].get("msg_id") != msg_id:  # e.g., left over from resetting the kernel
+                    continue
+
+                msg_type = msg["header"]["msg_type"]
+                content = msg["content"]
+                if msg_type == "status" and content["execution_state"] == "idle":
+                    break
+                if msg_type == "error":
+                    # Remove color codes
+                    content = ANSI_ESCAPE.sub("", "\n".join(content["traceback"]))
+                    yield {"type": "console", "format": "output", "content": content}
+                elif msg_type == "stream":
+                    text = content["text"]
+                    if head_budget > 0:
+                        head, text = text[:head_budget], text[head_budget:]
+                        head_budget -= len(head)
+                        yield {"type": "console", "format": "output", "content": head}
+                    if text:
+                        tail.append(text)
+                        tail_length += len(text)
+                        excess = tail_length - self.MAX_OUTPUT_LENGTH // 2
+                        while excess > 0:
+                            dropped = tail[0][:excess]
+                            tail[0] = tail[0][excess:]
+                            if not tail[0]:
+                                tail.popleft()
+                            num_truncated += len(dropped)
+                            tail_length -= len(dropped)
+                            excess -= len(dropped)
+
+            if num_truncated:
+                yield {
+                    "type": "console",
+                    "format": "output",
+                    "content": f"[... {num_truncated} characters of output truncated ...]"
+                }
+            if tail:
+                yield {"type": "console", "format": "output", "content": "".join(tail)}
         except GeneratorExit:
+            km.interrupt_kernel()  # stopped being consumed before finishing
             raise  # gotta pass this up!
         except:
             content = traceback.format_exc()
             yield {"type": "console", "format": "output", "content": content}
 
-    @staticmethod
-    def get_kernel_and_client():
-        setup_jupyter_logging()
-        km = KernelManager(
-            kernel_name='python3',
-            kernel_cmd=[sys.executable, '-m', 'ipykernel_launcher', '-f', '{connection_file}']
-        )
-        km.start_kernel(env=os.environ.copy())
-
-        kc = km.client()
-        kc.start_channels()
-        while not kc.is_alive():
-            time.sleep(0.1)
-        time.sleep(0.5)
-
-        return km, kc
-
-    @staticmethod
-    def stop_kernel_and_client(km, kc):
-        kc.stop_channels()
-        km.shutdown_kernel(now=True)
-
     def run_code(self, code):
         results = []
         errors = []
 
-        km, kc = self.get_kernel_and_client()
-        for res_dict in self._run_code(code, km, kc):
-            content = res_dict['content']
-            if 'Traceback' in content:
-                errors.append(content)
-            else:
-                results.append(content)
-        self.stop_kernel_and_client(km, kc)
+        kernel = kernel_pool.acquire(cwd=os.getcwd())
+        try:
+            for res_dict in self._run_code(code, kernel.km, kernel.kc):
+                content = res_dict['content']
+                if 'Traceback' in content:
+                    errors.append(content)
+                else:
+                    results.append(content)
+        finally:
+            kernel_pool.release(kernel)
         result = {
             'result': '\n'.join(results),
             'error': '\n'.join(errors)
@@ -148,8 +346,10 @@ class JupyterPython():
 
 
 class Python(Basic):
-    def __init__(self):
-        super().__init__()
+    CODE_TYPE = "python"
+
+    def __init__(self, cache_dir=None):
+        super().__init__(cache_dir=cache_dir)
         self.python_kernel = JupyterPython()
 
     def generate_code(self, query):
@@ -165,3 +365,6 @@ class Python(Basic):
     def execute_code(self, code):
         result = self.python_kernel.run_code(code)
         return result
+
+    def is_successful(self, result):
+        return not result['error']
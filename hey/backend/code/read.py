@@ -1,15 +1,19 @@
+import io
 import os
+import re
 import sys
-import csv
 import docx
 import json
+import math
 import base64
-import whisper
-import tempfile
+import time
+import hashlib
+import logging
+import threading
+import concurrent.futures
+import multiprocessing as mp
+from concurrent.futures.process import BrokenProcessPool
 import pandas as pd
-from PIL import Image
-from moviepy import *
-from cnocr import CnOcr
 from PyPDF2 import PdfReader
 from pptx import Presentation
 from Bio.PDB import PDBParser
@@ -18,12 +22,298 @@ from munch import DefaultMunch  # nested dict to object
 import xml.etree.ElementTree as ET
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from llm.registry import get_llm
+from hey.backend.llm.base import ErrorResponse
+from hey.backend.code.model_registry import model_registry
+from hey.utils.cache import DiskCache
+from hey.utils.video import extract_keyframes
+
+# A faster PDF backend, used if installed
+try:
+    import pypdfium2 as pdfium
+except ImportError:
+    pdfium = None
+
+MAX_CPU_WORKERS = 4
+_cpu_executor = None
+_cpu_executor_lock = threading.Lock()
+
+
+def _get_cpu_executor():
+    # Persistent across tool calls, so that worker processes (and what they
+    # have imported) are reused rather than started for every batch
+    global _cpu_executor
+    with _cpu_executor_lock:
+        if _cpu_executor is None:
+            _cpu_executor = concurrent.futures.ProcessPoolExecutor(
+                max_workers=min(MAX_CPU_WORKERS, os.cpu_count() or 1),
+                mp_context=mp.get_context("spawn")
+            )
+        return _cpu_executor
+
+
+def _discard_cpu_executor(executor):
+    global _cpu_executor
+    with _cpu_executor_lock:
+        if _cpu_executor is executor:
+            _cpu_executor = None
+    executor.shutdown(wait=False, cancel_futures=True)
+
+
+# CPU-bound decoders, kept at the module level so that they can run in worker processes
+def ocr_image(file_path):
+    with model_registry.use("cnocr") as ocr_model:
+        output = ocr_model.ocr(file_path)
+    extracted_text = []
+    for d in output:
+        text, score, position = d["text"], d["score"], d["position"]
+        extracted_text.append(text.strip())
+    return " ".join(extracted_text)
+
+
+def transcribe_audio(file_path):
+    with model_registry.use("whisper") as model:
+        result = model.transcribe(file_path, fp16=False)
+    return result.get("text", "")
+
+
+TABLE_SAMPLE_ROWS = 10
+FULL_TABLE_MAX_ROWS = 500  # smaller tables are returned in full
+CSV_CHUNK_ROWS = 200000
+IN_MEMORY_CSV_MAX_SIZE_IN_BYTES = 64 * 1024 * 1024
+
+
+def _to_records(df):
+    # Through JSON, so that NaN, timestamps and numpy types come out serializable
+    return json.loads(df.to_json(orient="records", date_format="iso", default_handler=str))
+
+
+def summarize_table(chunks):
+    """Describe a table given as DataFrame chunks, holding at most one chunk in memory.
+
+    Small tables are returned in full. Larger ones are returned as their
+    schema, per-column statistics, and head and tail samples.
+    """
+    num_rows = 0
+    dtypes = {}
+    head = tail = None
+    full_chunks = []
+    statistics = {}
+    for chunk in chunks:
+        if head is None:
+            dtypes = {str(column): str(dtype) for column, dtype in chunk.dtypes.items()}
+            head = chunk.head(TABLE_SAMPLE_ROWS)
+        tail = chunk.tail(TABLE_SAMPLE_ROWS) if tail is None \
+            else pd.concat([tail, chunk.tail(TABLE_SAMPLE_ROWS)]).tail(TABLE_SAMPLE_ROWS)
+        num_rows += len(chunk)
+        if num_rows > FULL_TABLE_MAX_ROWS:
+            full_chunks = None
+        elif full_chunks is not None:
+            full_chunks.append(chunk)
+
+        non_null_counts = chunk.count()
+        for column in chunk.columns:
+            column_statistics = statistics.setdefault(str(column), {"non_null": 0, "null": 0})
+            column_statistics["non_null"] += int(non_null_counts[column])
+            column_statistics["null"] += len(chunk) - int(non_null_counts[column])
+        for column, values in chunk.select_dtypes("number").items():
+            values = values.dropna().astype(float)
+            if values.empty:
+                continue
+            column_statistics = statistics[str(column)]
+            column_statistics["min"] = min(column_statistics.get("min", math.inf), values.min())
+            column_statistics["max"] = max(column_statistics.get("max", -math.inf), values.max())
+            column_statistics["sum"] = column_statistics.get("sum", 0.0) + values.sum()
+            column_statistics["sum_of_squares"] = column_statistics.get("sum_of_squares", 0.0) + (values ** 2).sum()
+
+    result = {"num_rows": num_rows, "columns": dtypes}
+    if full_chunks is not None:
+        result["content"] = _to_records(pd.concat(full_chunks)) if full_chunks else []
+        return result
+
+    for column_statistics in statistics.values():
+        if "sum" not in column_statistics:
+            continue
+        n = column_statistics["non_null"]
+        mean = column_statistics.pop("sum") / n
+        variance = max(float(column_statistics.pop("sum_of_squares")) / n - mean ** 2, 0.0)
+        column_statistics["mean"] = float(mean)
+        column_statistics["std"] = math.sqrt(variance * n / (n - 1)) if n > 1 else 0.0
+        column_statistics["min"] = float(column_statistics["min"])
+        column_statistics["max"] = float(column_statistics["max"])
+    result.update({
+        "statistics": statistics,
+        "head": _to_records(head),
+        "tail": _to_records(tail),
+        "note": f"Only {TABLE_SAMPLE_ROWS} rows from each end are shown. "
+                f"Select columns and rows to read, or analyze the file with code."
+    })
+    return result
+
+
+def check_columns(columns, available_columns):
+    """Return an error listing the available columns if any of `columns` is missing, otherwise None."""
+    available_columns = [str(column) for column in available_columns]
+    missing_columns = [column for column in columns or [] if column not in available_columns]
+    if not missing_columns:
+        return None
+    return {"error": f"No such columns: {missing_columns}", "available_columns": available_columns}
+
+
+def read_csv_table(file_path, columns=None, max_rows=None):
+    # Otherwise, missing columns would silently read as an empty table
+    error = check_columns(columns, pd.read_csv(file_path, nrows=0).columns)
+    if error:
+        return error
+
+    usecols = None if not columns else (lambda column: column in set(columns))
+    if os.path.getsize(file_path) > IN_MEMORY_CSV_MAX_SIZE_IN_BYTES:
+        with pd.read_csv(file_path, usecols=usecols, nrows=max_rows, chunksize=CSV_CHUNK_ROWS) as chunks:
+            return summarize_table(chunks)
+
+    if max_rows is None:  # not supported by the pyarrow engine
+        try:
+            return summarize_table([pd.read_csv(file_path, usecols=columns or None, engine="pyarrow")])
+        except ImportError as e:
+            logging.info(f"Falling back to the slower default CSV engine, as pyarrow is not installed: {e}")
+        except Exception as e:  # a file pyarrow cannot parse
+            logging.debug(f"Falling back to the default CSV engine for {file_path} due to {e}")
+    return summarize_table([pd.read_csv(file_path, usecols=usecols, nrows=max_rows)])
+
+
+def read_excel_tables(file_path, columns=None, max_rows=None):
+    xls = pd.ExcelFile(file_path)
+    tables = {}
+    for sheet in xls.sheet_names:
+        df = pd.read_excel(xls, sheet_name=sheet, nrows=max_rows)
+        tables[sheet] = check_columns(columns, df.columns)
+        if tables[sheet] is None:
+            if columns:
+                df = df[[column for column in df.columns if str(column) in set(columns)]]
+            tables[sheet] = summarize_table([df])
+    return tables
+
+
+class PdfPages():
+    """Text of PDF pages, extracted one page at a time on demand."""
+
+    def __init__(self, file_path):
+        if pdfium is not None:
+            self.document = pdfium.PdfDocument(file_path)
+            self.num_pages = len(self.document)
+        else:
+            self.document = PdfReader(file_path)
+            self.num_pages = len(self.document.pages)
+
+    def get_text(self, index):
+        if pdfium is None:
+            return self.document.pages[index].extract_text() or ""
+
+        page = self.document[index]
+        text_page = page.get_textpage()
+        try:
+            return text_page.get_text_range()
+        finally:
+            text_page.close()
+            page.close()
+
+    def close(self):
+        if pdfium is not None:
+            self.document.close()
+
+
+def parse_page_ranges(pages, num_pages):
+    """Turn e.g. "1-3,7" (1-based, inclusive) into 0-based page indices."""
+    indices = []
+    for part in pages.split(","):
+        bounds = part.strip().split("-")
+        if not bounds[0].isdigit() or not bounds[-1].isdigit():
+            continue
+        start, end = int(bounds[0]), int(bounds[-1])
+        indices.extend(i - 1 for i in range(start, end + 1) if 1 <= i <= num_pages and i - 1 not in indices)
+    return indices
+
+
+def rank_pages_by_query(page_texts, query):
+    """Order page indices by a TF-IDF-like lexical match with the query.
+
+    Pages not matching at all are left out, unless no page matches.
+    """
+    terms = set(re.findall(r"\w+", query.lower()))
+    page_terms = {index: re.findall(r"\w+", text.lower()) for index, text in page_texts.items()}
+    document_frequency = {
+        term: sum(term in set(words) for words in page_terms.values()) for term in terms
+    }
+
+    def score(index):
+        words = page_terms[index]
+        return sum(
+            math.log(1 + words.count(term)) * math.log(1 + len(page_terms) / document_frequency[term])
+            for term in terms if document_frequency[term]
+        )
+    scores = {index: score(index) for index in page_texts}
+    matching = [index for index in page_texts if scores[index] > 0] or list(page_texts)
+    return sorted(matching, key=lambda index: (-scores[index], index))
+
+
+def extract_pdf_text(file_path, max_length=None, pages=None, query=None):
+    """Return (text, number of pages), extracting only as many pages as `max_length` needs.
+
+    Pages can be restricted with `pages` (e.g., "1-3,7"). With a `query`,
+    pages are picked by relevance rather than in order, which requires the
+    text of all candidate pages but still returns the best ones first.
+    """
+    pdf = PdfPages(file_path)
+    try:
+        indices = parse_page_ranges(pages, pdf.num_pages) if pages else list(range(pdf.num_pages))
+        if query:
+            page_texts = {index: pdf.get_text(index) for index in indices}
+            get_text = page_texts.get
+            indices = rank_pages_by_query(page_texts, query)
+        else:
+            get_text = pdf.get_text
+
+        selected = []
+        length = 0
+        for index in indices:
+            page_text = get_text(index)
+            if not page_text:
+                continue
+            selected.append((index, page_text))
+            length += len(page_text)
+            if max_length is not None and length >= max_length:
+                break
+    finally:
+        pdf.close()
+
+    if not (pages or query):
+        return "\n".join(page_text for _, page_text in selected), pdf.num_pages
+
+    # Pages out of their natural order (or range) are labeled, and returned in reading order
+    return "\n".join(f"[Page {index + 1}]\n{page_text}" for index, page_text in sorted(selected)), pdf.num_pages
 
 
 class SemanticRead:
     MAX_CONTENT_LENGTH = 10000  # TODO: avoid hard-coding
+    MAX_VIDEO_KEYFRAMES = 6  # each one costs a caption
+    # Types whose decoding is CPU-bound, and worth a worker process when a batch has several
+    CPU_BOUND_FILE_TYPES = {"image", "audio", "video", "pdf", "csv", "excel"}
+    # Options of `process` that only some file types take
+    READ_OPTIONS_OF_FILE_TYPES = {
+        "pdf": ("pages", "query"),
+        "csv": ("columns", "max_rows"),
+        "excel": ("columns", "max_rows")
+    }
+    MAX_CONCURRENT_FILES = 8
+    FILE_TIMEOUT_IN_SEC = 600
+    # Bump whenever the extraction output changes, which invalidates cached results
+    EXTRACTOR_VERSION = 2
+    # Larger files are identified by their path, size and mtime rather than hashed
+    MAX_HASHED_FILE_SIZE_IN_BYTES = 64 * 1024 * 1024
+
+    def __init__(self, cache_dir=None):
+        self.cpu_executor = None  # None means decoding in the calling thread
+        self.cache = None if cache_dir is None else DiskCache(cache_dir, max_size_in_bytes=1024 * 1024 * 1024)
 
-    def __init__(self):
         # These models are independent of the agent framework and should be deemed as a third-party tool
         # therefore, we do not enable configuration of them and assume that they are just off-the-shelf product
         # This is why we have these hard-coded
@@ -45,6 +335,22 @@ class SemanticRead:
         llm_config = DefaultMunch.fromDict(llm_config)
         self.llm = get_llm(llm_config)
 
+    def submit_cpu_bound(self, func, *args):
+        if self.cpu_executor is None:
+            future = concurrent.futures.Future()
+            try:
+                future.set_result(func(*args))
+            except Exception as e:
+                future.set_exception(e)
+            return future
+
+        try:
+            return self.cpu_executor.submit(func, *args)
+        except BrokenProcessPool:  # e.g., a worker was killed for OOM
+            _discard_cpu_executor(self.cpu_executor)
+            self.cpu_executor = _get_cpu_executor()
+            return self.cpu_executor.submit(func, *args)
+
     def extract_path_list(self, overall_task, task):
         system_prompt = '''
 Basic on the context and the current specific task, please figure out the absolute file path of the file in question.
@@ -155,30 +461,26 @@ Current subtask: {task}
 
     def process_image_file(self, file_path):
         """Process an image file: perform OCR and generate a caption."""
-        output = CnOcr().ocr(file_path)
-        extracted_text = []
-        for d in output:
-            text, score, position = d["text"], d["score"], d["position"]
-            extracted_text.append(text.strip())
-        ocr_text = " ".join(extracted_text)
+        ocr_future = self.submit_cpu_bound(ocr_image, file_path)  # overlapping with the caption
 
         with open(file_path, 'rb') as img_file:
             img_bytes = img_file.read()
             caption = self.get_image_caption(img_bytes, os.path.splitext(file_path)[1].lower())
-        return {
+        ocr_text = ocr_future.result()
+        result = {
             "type": "image",
             "ocr_text": ocr_text.strip()[:self.MAX_CONTENT_LENGTH],
             "caption": caption.strip()[:self.MAX_CONTENT_LENGTH]
         }
+        if isinstance(caption, ErrorResponse):
+            result.update({"caption": "", "error": f"Failed to caption the image: {caption}"})
+        return result
 
-    def process_pdf_file(self, file_path):
-        reader = PdfReader(file_path)
-        text = ""
-        for page in reader.pages:
-            page_text = page.extract_text()
-            if page_text:
-                text += page_text + "\n"
-        return {"type": "pdf", "content": text.strip()[:self.MAX_CONTENT_LENGTH]}
+    def process_pdf_file(self, file_path, pages=None, query=None):
+        text, num_pages = self.submit_cpu_bound(
+            extract_pdf_text, file_path, self.MAX_CONTENT_LENGTH, pages, query
+        ).result()
+        return {"type": "pdf", "num_pages": num_pages, "content": text.strip()[:self.MAX_CONTENT_LENGTH]}
 
     @staticmethod
     def process_word_file(file_path):
@@ -187,14 +489,9 @@ Current subtask: {task}
         text = "\n".join([para.text for para in doc.paragraphs])
         return {"type": "word", "content": text}
 
-    @staticmethod
-    def process_excel_file(file_path):
-        """Process an Excel file: extract sheet data as dictionaries."""
-        xls = pd.ExcelFile(file_path)
-        sheets_data = {}
-        for sheet in xls.sheet_names:
-            df = pd.read_excel(xls, sheet_name=sheet)
-            sheets_data[sheet] = df.to_dict(orient='records')
+    def process_excel_file(self, file_path, columns=None, max_rows=None):
+        """Process an Excel file: extract sheet data as dictionaries, or summaries of large sheets."""
+        sheets_data = self.submit_cpu_bound(read_excel_tables, file_path, columns, max_rows).result()
         return {"type": "excel", "content": sheets_data}
 
     @staticmethod
@@ -213,41 +510,48 @@ Current subtask: {task}
             })
         return {"type": "powerpoint", "slides": slides_data}
 
-    @staticmethod
-    def transcribe_audio(file_path):
+    def transcribe_audio(self, file_path):
         """Transcribe an audio file using a speech-to-text model (e.g., Whisper)."""
-        model = whisper.load_model("base")
-        result = model.transcribe(file_path, fp16=False)
-        return result.get("text", "")
+        return self.submit_cpu_bound(transcribe_audio, file_path).result()
 
     def process_audio_file(self, file_path):
         """Process an audio file: perform transcription."""
         transcript = self.transcribe_audio(file_path)
         return {"type": "audio", "transcript": transcript}
 
+    def caption_a_frame(self, frame):
+        buffer = io.BytesIO()
+        frame.save(buffer, format="JPEG")
+        return self.get_image_caption(img_bytes=buffer.getvalue(), ext='.jpg')
+
     def process_video_file(self, file_path):
-        """Process a video file: extract audio for transcription and a key frame for a caption."""
-        clip = VideoFileClip(file_path)
-        audio_temp = tempfile.NamedTemporaryFile(suffix=".wav", delete=False)
-        audio_path = audio_temp.name
-        clip.audio.write_audiofile(audio_path, logger=None)
-        transcript = self.transcribe_audio(audio_path)
-        os.remove(audio_path)
-
-        frame_time = clip.duration / 2
-        frame = clip.get_frame(frame_time)
-        temp_img_file = tempfile.NamedTemporaryFile(suffix=".jpg", delete=False)
-        temp_img_path = temp_img_file.name
-        temp_img_file.close()
-        img = Image.fromarray(frame)
-        img.save(temp_img_path, format="JPEG")
-
-        with open(temp_img_path, "rb") as f:
-            img_bytes = f.read()
-        caption = self.get_image_caption(img_bytes=img_bytes, ext='.jpg')
-        os.remove(temp_img_path)
-
-        return {"type": "video", "transcript": transcript, "half_duration_frame_caption": caption}
+        """Process a video file: transcribe its audio and caption its keyframes, decoding it once."""
+        # Whisper decodes the audio track itself through an ffmpeg pipe, so no copy is written.
+        # On a thread, as the CPU pool is not used for single files, to overlap with the keyframes
+        with concurrent.futures.ThreadPoolExecutor(max_workers=1) as transcriber:
+            transcript_future = transcriber.submit(self.transcribe_audio, file_path)
+
+            keyframes = extract_keyframes(file_path, self.MAX_VIDEO_KEYFRAMES)
+            with concurrent.futures.ThreadPoolExecutor(max_workers=max(len(keyframes), 1)) as executor:
+                captions = list(executor.map(self.caption_a_frame, [frame for _, frame in keyframes]))
+
+            try:
+                transcript = transcript_future.result()
+            except RuntimeError as e:  # e.g., a video without an audio track
+                logging.info(f"No transcript for {file_path} due to {e}")
+                transcript = ""
+        result = {
+            "type": "video",
+            "transcript": transcript,
+            "keyframe_captions": [
+                {"time_in_sec": timestamp, "caption": "" if isinstance(caption, ErrorResponse) else caption}
+                for (timestamp, _), caption in zip(keyframes, captions)
+            ]
+        }
+        errors = [caption for caption in captions if isinstance(caption, ErrorResponse)]
+        if errors:
+            result["error"] = f"Failed to caption {len(errors)} keyframe(s): {errors[0]}"
+        return result
 
     @staticmethod
     def process_pdb_file(file_path):
@@ -263,13 +567,10 @@ Current subtask: {task}
                 summary[chain_id] = len(residues)
         return {"type": "pdb", "summary": summary}
 
-    @staticmethod
-    def process_csv_file(file_path):
-        """Process a CSV file: extract its rows as a list of dictionaries."""
-        with open(file_path, 'r', encoding='utf-8') as f:
-            reader = csv.DictReader(f)
-            rows = list(reader)
-        return {"type": "csv", "content": rows}
+    def process_csv_file(self, file_path, columns=None, max_rows=None):
+        """Process a CSV file: extract its rows as a list of dictionaries, or a summary of a large file."""
+        table = self.submit_cpu_bound(read_csv_table, file_path, columns, max_rows).result()
+        return {"type": "csv", **table}
 
     @staticmethod
     def process_json_file(file_path):
@@ -304,21 +605,68 @@ Current subtask: {task}
         text = soup.get_text(separator="\n", strip=True)
         return {"type": "html", "content": text}
 
-    def _process(self, file_path):
+    def get_file_identity(self, file_path):
+        stat = os.stat(file_path)
+        if stat.st_size > self.MAX_HASHED_FILE_SIZE_IN_BYTES:
+            return ["stat", os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns]
+
+        sha256 = hashlib.sha256()
+        with open(file_path, "rb") as fin:
+            for data in iter(lambda: fin.read(1024 * 1024), b""):
+                sha256.update(data)
+        return ["sha256", sha256.hexdigest()]
+
+    def get_models_of_file_type(self, file_type):
+        """The models whose output the extraction of a file type depends on."""
+        models = []
+        if file_type in ("image", "video"):
+            models.append(self.vllm.model_name)
+        if file_type == "image":
+            models += [os.getenv("CNOCR_DET_MODEL_NAME", ""), os.getenv("CNOCR_REC_MODEL_NAME", "")]
+        if file_type in ("audio", "video"):
+            models.append(os.getenv("WHISPER_MODEL_NAME", "base"))
+        return models
+
+    def _process(self, file_path, read_options=None):
         if not os.path.exists(file_path):
             raise ValueError(f"File not found: {file_path}")
+        option_names = self.READ_OPTIONS_OF_FILE_TYPES.get(self.detect_file_type(file_path), ())
+        read_options = {
+            name: value for name, value in (read_options or {}).items()
+            if name in option_names and value
+        }
+        if self.cache is None:
+            return self._extract(file_path, read_options)
+
+        # The same files tend to be read again by later subtasks, retries and queries
+        cache_key = [
+            self.get_file_identity(file_path),
+            self.EXTRACTOR_VERSION,
+            self.MAX_CONTENT_LENGTH,
+            self.get_models_of_file_type(self.detect_file_type(file_path)),
+            sorted(read_options.items())
+        ]
+        result = self.cache.get(cache_key)
+        if result is None:
+            result = self._extract(file_path, read_options)
+            if "error" not in result:  # e.g., a failed caption, which a retry may get right
+                self.cache.set(cache_key, result)
+        else:
+            logging.info(f"Content of {file_path} served from the cache")
+        return result
 
+    def _extract(self, file_path, read_options):
         file_type = self.detect_file_type(file_path)
         if file_type == 'text':
             result = self.process_text_file(file_path)
         elif file_type == 'image':
             result = self.process_image_file(file_path)
         elif file_type == 'pdf':
-            result = self.process_pdf_file(file_path)
+            result = self.process_pdf_file(file_path, **read_options)
         elif file_type == 'word':
             result = self.process_word_file(file_path)
         elif file_type == 'excel':
-            result = self.process_excel_file(file_path)
+            result = self.process_excel_file(file_path, **read_options)
         elif file_type == 'powerpoint':
             result = self.process_powerpoint_file(file_path)
         elif file_type == 'audio':
@@ -328,7 +676,7 @@ Current subtask: {task}
         elif file_type == 'pdb':
             result = self.process_pdb_file(file_path)
         elif file_type == 'csv':
-            result = self.process_csv_file(file_path)
+            result = self.process_csv_file(file_path, **read_options)
         elif file_type == 'json':
             result = self.process_json_file(file_path)
         elif file_type == 'jsonld':
@@ -342,8 +690,76 @@ Current subtask: {task}
 
         return result
 
-    def process(self, file_path_list):
+    @staticmethod
+    def _run_in_a_thread(func, *args):
+        # A daemon thread, unlike those of executors, can be abandoned on timeout
+        future = concurrent.futures.Future()
+
+        def run():
+            try:
+                future.set_result(func(*args))
+            except Exception as e:
+                future.set_exception(e)
+
+        threading.Thread(target=run, daemon=True).start()
+        return future
+
+    def process(self, file_path_list, pages=None, query=None, columns=None, max_rows=None):
+        """Read files concurrently, returning their results in input order.
+
+        Each file is handled in a thread, where LLM calls (e.g., for captions)
+        wait on the network, while CPU-bound decoding is sent to a persistent
+        process pool if the batch holds more than one such file. Up to
+        `MAX_CONCURRENT_FILES` files are read at a time, each given
+        `FILE_TIMEOUT_IN_SEC` from when it starts. A file that fails or runs
+        out of time raises if read alone, and gets an error entry in a batch
+        instead of failing the others. Work that timed out cannot be cancelled:
+        it is abandoned and keeps running (e.g., in the process pool) until it
+        ends by itself, but no longer holds up the files after it.
+
+        `pages` (e.g., "1-3,7") and `query` only apply to PDFs, see `extract_pdf_text`,
+        and `columns` and `max_rows` to tables, see `summarize_table`.
+        """
+        read_options = {"pages": pages, "query": query, "columns": columns, "max_rows": max_rows}
+        file_types = [self.detect_file_type(file_path) for file_path in file_path_list]
+        if sum(file_type in self.CPU_BOUND_FILE_TYPES for file_type in file_types) > 1:
+            self.cpu_executor = _get_cpu_executor()
+
+        waiting = list(range(len(file_path_list)))[::-1]  # popped from the end
+        running = {}  # future -> (index, deadline)
+        outcomes = [None] * len(file_path_list)  # (result, error)
+        while waiting or running:
+            while waiting and len(running) < self.MAX_CONCURRENT_FILES:
+                index = waiting.pop()
+                future = self._run_in_a_thread(self._process, file_path_list[index], read_options)
+                running[future] = (index, time.monotonic() + self.FILE_TIMEOUT_IN_SEC)
+
+            next_deadline = min(deadline for _, deadline in running.values())
+            concurrent.futures.wait(
+                running, timeout=max(next_deadline - time.monotonic(), 0),
+                return_when=concurrent.futures.FIRST_COMPLETED
+            )
+            for future, (index, deadline) in list(running.items()):
+                if future.done():
+                    outcomes[index] = (None, future.exception()) if future.exception() is not None \
+                        else (future.result(), None)
+                elif time.monotonic() >= deadline:
+                    outcomes[index] = (None, TimeoutError(f"Not read within {self.FILE_TIMEOUT_IN_SEC}s."))
+                else:
+                    continue
+                del running[future]
+
+        if len(file_path_list) == 1:
+            result, error = outcomes[0]
+            if error is not None:
+                raise error
+            return [result]
+
         result_list = []
-        for file_path in file_path_list:
-            result_list.append(self._process(file_path))
+        for file_path, file_type, (result, error) in zip(file_path_list, file_types, outcomes):
+            if error is None:
+                result_list.append(result)
+                continue
+            logging.error(f"Failed to read {file_path}: {error}")
+            result_list.append({"type": file_type, "file_path": file_path, "error": f"{error}"})
         return result_list
@@ -0,0 +1,159 @@
+import zlib
+import pickle
+from abc import abstractmethod, ABCMeta
+
+
+class BaseIPC(metaclass=ABCMeta):
+    """State shared between the main process, the workers and the MCP servers.
+
+    Backends only implement the primitives below on full keys and raw bytes,
+    while key naming and serialization are kept here so that they are
+    identical whichever backend is selected in config.yml.
+    """
+    # Pickled values larger than this are compressed (None to disable)
+    COMPRESSION_THRESHOLD_IN_BYTES = 64 * 1024
+    COMPRESSION_MAGIC = b"HEYZ"
+
+    def __init__(self, root):
+        self.root = root
+
+    @classmethod
+    def prepare(cls, ipc_config):
+        """Run once in the main process before any worker exists.
+
+        Returns the configuration with which every process connects, e.g.,
+        after starting a server that the workers are to reach.
+        """
+        return ipc_config
+
+    @abstractmethod
+    def _set_a_value(self, key, raw_value):
+        pass
+
+    @abstractmethod
+    def _get_a_value(self, key):
+        pass
+
+    @abstractmethod
+    def _delete_keys(self, keys):
+        pass
+
+    @abstractmethod
+    def _push_a_value(self, key, raw_value):
+        pass
+
+    @abstractmethod
+    def _pop_a_value(self, key, blocking, timeout):
+        pass
+
+    @abstractmethod
+    def _set_a_field(self, key, field, raw_value):
+        pass
+
+    @abstractmethod
+    def _get_fields(self, key, fields):
+        pass
+
+    @abstractmethod
+    def _scan_keys(self, pattern):
+        pass
+
+    @abstractmethod
+    def _publish_a_value(self, channel, raw_value):
+        pass
+
+    @abstractmethod
+    def _subscribe_channels(self, channels):
+        """Return a subscriber whose `listen()` yields Redis-style message dicts."""
+        pass
+
+    @staticmethod
+    def _list_to_key(key_list):
+        key_list = [str(e) for e in key_list]
+        key = "/" + "/".join(key_list)
+        return key
+
+    def _full_key(self, key):
+        if isinstance(key, list):
+            key = self._list_to_key(key_list=key)
+        return f"{self.root}/{key}"
+
+    def _dumps(self, value):
+        raw_value = pickle.dumps(value)
+        if (self.COMPRESSION_THRESHOLD_IN_BYTES is not None
+                and len(raw_value) > self.COMPRESSION_THRESHOLD_IN_BYTES):
+            raw_value = self.COMPRESSION_MAGIC + zlib.compress(raw_value, 1)
+        return raw_value
+
+    def _loads(self, raw_value):
+        if raw_value is None:
+            return None
+        if raw_value.startswith(self.COMPRESSION_MAGIC):
+            raw_value = zlib.decompress(raw_value[len(self.COMPRESSION_MAGIC):])
+        return pickle.loads(raw_value)
+
+    def set_a_shared_value(self, key, value):
+        self._set_a_value(key=self._full_key(key), raw_value=self._dumps(value))
+
+    def get_a_shared_value(self, key):
+        return self._loads(self._get_a_value(key=self._full_key(key)))
+
+    def delete_a_shared_value(self, key):
+        self._delete_keys(keys=[self._full_key(key)])
+
+    # Lists hand values over between processes: a blocked consumer sleeps
+    # until a value is pushed, without polling
+    def push_a_shared_value(self, key, value):
+        self._push_a_value(key=self._full_key(key), raw_value=self._dumps(value))
+
+    def pop_a_shared_value(self, key, blocking=False, timeout=0):  # timeout=0 means waiting forever
+        return self._loads(self._pop_a_value(
+            key=self._full_key(key),
+            blocking=blocking,
+            timeout=timeout
+        ))
+
+    # Hash fields let one entry of a collection be read or written without
+    # transferring (and racing on) the whole collection
+    def set_a_shared_field(self, key, field, value):
+        self._set_a_field(key=self._full_key(key), field=field, raw_value=self._dumps(value))
+
+    def get_a_shared_field(self, key, field):
+        return self.get_shared_fields(key=key, fields=[field])[0]
+
+    def get_shared_fields(self, key, fields):
+        if not fields:
+            return []
+        raw_values = self._get_fields(key=self._full_key(key), fields=fields)
+        return [self._loads(raw_value) for raw_value in raw_values]
+
+    def _keys_of_a_prefix(self, prefix):
+        if isinstance(prefix, list):
+            prefix = self._list_to_key(key_list=prefix)
+        if len(prefix) == 0:
+            prefix = "*"
+        else:
+            prefix = f"{prefix}/*"
+        prefix = f"{self.root}/{prefix}"
+
+        # Note that scanning can be too slow!
+        # So do not abuse this function.
+        return self._scan_keys(pattern=prefix)
+
+    def delete_all_keys(self):
+        keys = self._keys_of_a_prefix(prefix="")
+        if keys:
+            self._delete_keys(keys=keys)
+
+    # Channels are namespaced like keys, so that concurrent runs never hear each other
+    def _full_channel(self, channel):
+        return f"{self.root}/{channel}"
+
+    def channel_of_a_message(self, message):
+        return message["channel"].decode()[len(self.root) + 1:]
+
+    def publish_a_value(self, channel, value):
+        self._publish_a_value(channel=self._full_channel(channel), raw_value=pickle.dumps(value))
+
+    def subscribe_channels(self, channels):
+        return self._subscribe_channels(channels=[self._full_channel(channel) for channel in channels])
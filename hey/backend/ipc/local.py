@@ -0,0 +1,203 @@
+import os
+import uuid
+import queue
+import fnmatch
+import itertools
+import tempfile
+import threading
+import multiprocessing as mp
+from collections import deque
+from multiprocessing.managers import BaseManager
+
+from hey.backend.ipc.base import BaseIPC
+
+
+class LocalStore():
+    """A Redis-like in-memory store living in a server process of the main process.
+
+    Strings are kept as bytes, hashes as dicts and lists as deques. Every
+    client connection is served by its own thread, so blocking calls only
+    block their caller.
+    """
+
+    def __init__(self):
+        self._values = {}
+        self._condition = threading.Condition()
+        self._subscriptions = {}  # subscription id -> (channels, message queue)
+        self._subscription_ids = itertools.count()
+
+    def set(self, key, raw_value):
+        with self._condition:
+            self._values[key] = raw_value
+
+    def get(self, key):
+        with self._condition:
+            return self._values.get(key)
+
+    def delete(self, keys):
+        with self._condition:
+            for key in keys:
+                self._values.pop(key, None)
+
+    def rpush(self, key, raw_value):
+        with self._condition:
+            self._values.setdefault(key, deque()).append(raw_value)
+            self._condition.notify_all()
+
+    def lpop(self, key, blocking=False, timeout=0):
+        with self._condition:
+            if blocking:
+                self._condition.wait_for(lambda: self._values.get(key),
+                                         timeout=timeout or None)
+            values = self._values.get(key)
+            if not values:
+                return None
+            raw_value = values.popleft()
+            if not values:
+                del self._values[key]
+            return raw_value
+
+    def hset(self, key, field, raw_value):
+        with self._condition:
+            self._values.setdefault(key, {})[field] = raw_value
+
+    def hmget(self, key, fields):
+        with self._condition:
+            fields_and_values = self._values.get(key, {})
+            return [fields_and_values.get(field) for field in fields]
+
+    def keys(self, pattern):
+        with self._condition:
+            return [key for key in self._values if fnmatch.fnmatchcase(key, pattern)]
+
+    def subscribe(self, channels):
+        subscription_id = next(self._subscription_ids)
+        self._subscriptions[subscription_id] = (set(channels), queue.Queue())
+        return subscription_id
+
+    def unsubscribe(self, subscription_id):
+        subscription = self._subscriptions.pop(subscription_id, None)
+        if subscription is not None:
+            subscription[1].put(None)  # wakes up a pending `get_message`
+
+    def publish(self, channel, raw_value):
+        for channels, messages in list(self._subscriptions.values()):
+            if channel in channels:
+                messages.put((channel, raw_value))
+
+    def get_message(self, subscription_id):
+        subscription = self._subscriptions.get(subscription_id)
+        if subscription is None:
+            return None
+        return subscription[1].get()
+
+
+_store = None
+
+
+def _get_store():  # only called in the server process
+    global _store
+    if _store is None:
+        _store = LocalStore()
+    return _store
+
+
+class StoreManager(BaseManager):
+    pass
+
+
+StoreManager.register("get_store", callable=_get_store)
+
+_store_manager = None  # kept referenced, as the server stops once it is collected
+_store_authkey = None
+_store_proxies = {}
+
+
+def _connect_to_store(address, authkey):
+    # One proxy per server and process, shared by all LocalIPC instances.
+    # Proxies open one connection per thread by themselves.
+    if address not in _store_proxies:
+        manager = StoreManager(address=address, authkey=bytes.fromhex(authkey))
+        manager.connect()
+        _store_proxies[address] = manager.get_store()
+    return _store_proxies[address]
+
+
+class LocalSubscriber():
+    def __init__(self, store, channels):
+        self.store = store
+        self.subscription_id = store.subscribe(channels)
+
+    def listen(self):
+        while True:
+            message = self.store.get_message(self.subscription_id)
+            if message is None:  # unsubscribed
+                return
+            channel, raw_value = message
+            yield {"type": "message", "channel": channel.encode(), "data": raw_value}
+
+    def close(self):
+        self.store.unsubscribe(self.subscription_id)
+
+
+class LocalIPC(BaseIPC):
+    """Shared state for single-host runs, needing no Redis server.
+
+    The store is served over a Unix socket by a process that the main process
+    starts, and values never go through the TCP stack.
+    """
+
+    def __init__(self, root, address, authkey, key_ttl_in_sec=None):
+        # Keys need no TTL, as the store goes away with the main process
+        super().__init__(root)
+        self.address = address
+        self.authkey = authkey
+
+    @classmethod
+    def prepare(cls, ipc_config):
+        global _store_manager, _store_authkey
+        if _store_manager is None:
+            address = os.path.join(tempfile.gettempdir(), f"hey-ipc-{uuid.uuid4().hex[:12]}.sock")
+            _store_authkey = os.urandom(32)
+            _store_manager = StoreManager(address=address, authkey=_store_authkey,
+                                          ctx=mp.get_context("spawn"))
+            _store_manager.start()
+
+        ipc_config = dict(ipc_config)
+        ipc_config["address"] = _store_manager.address
+        ipc_config["authkey"] = _store_authkey.hex()
+        return ipc_config
+
+    @property
+    def store(self):  # not kept as an attribute so that instances stay picklable
+        return _connect_to_store(self.address, self.authkey)
+
+    def _set_a_value(self, key, raw_value):
+        self.store.set(key, raw_value)
+
+    def _get_a_value(self, key):
+        return self.store.get(key)
+
+    def _delete_keys(self, keys):
+        self.store.delete(keys)
+
+    def _push_a_value(self, key, raw_value):
+        self.store.rpush(key, raw_value)
+
+    def _pop_a_value(self, key, blocking, timeout):
+        return self.store.lpop(key, blocking, timeout)
+
+    def _set_a_field(self, key, field, raw_value):
+        self.store.hset(key, field, raw_value)
+
+    def _get_fields(self, key, fields):
+        return self.store.hmget(key, fields)
+
+    def _scan_keys(self, pattern):
+        return self.store.keys(pattern)
+
+    def _publish_a_value(self, channel, raw_value):
+        self.store.publish(channel, raw_value)
+
+    def _subscribe_channels(self, channels):
+        return LocalSubscriber(self.store, channels)
@@ -1,96 +1,88 @@
-import time
 import redis
-import pickle
 import socket
 
-redis_pool = redis.ConnectionPool(
-    host='127.0.0.1',
-    port='6379',
-    db=0,
-    socket_keepalive=True,
-    socket_keepalive_options={
-        socket.TCP_KEEPCNT: 2,
-        socket.TCP_KEEPINTVL: 30
-    }
-)
-r = redis.Redis(connection_pool=redis_pool)
-
-
-class RedisIPC(object):
-    GET_WAITING_TIME_IN_SEC = 0.5
-
-    def __init__(self, root):
-        self.root = root
-
-    @staticmethod
-    def _list_to_key(key_list):
-        key_list = [str(e) for e in key_list]
-        key = "/" + "/".join(key_list)
-        return key
-
-    def _set_a_value(self, key, value):
-        if isinstance(key, list):
-            key = self._list_to_key(key_list=key)
-        key = f"{self.root}/{key}"
-        r.set(name=key, value=pickle.dumps(value))
-
-    def set_a_shared_value(self, key, value):
-        self._set_a_value(key=key, value=value)
-
-    def _get_a_value(self, key, busy_waiting=False):
-        if isinstance(key, list):
-            key = self._list_to_key(key_list=key)
-        key = f"{self.root}/{key}"
-
-        raw_value = r.get(key)
-        if raw_value is None:
-            if busy_waiting:
-                while not raw_value:
-                    time.sleep(self.GET_WAITING_TIME_IN_SEC)
-                    raw_value = r.get(key)
-                return pickle.loads(raw_value)
-            else:
-                return None
-        else:
-            return pickle.loads(raw_value)
-
-    def get_a_shared_value(self, key, busy_waiting=False):
-        return self._get_a_value(key=key, busy_waiting=busy_waiting)
-
-    def _delete_a_key(self, key):
-        if isinstance(key, list):
-            key = self._list_to_key(key_list=key)
-        key = f"{self.root}/{key}"
-        r.delete(key)
-
-    def delete_a_shared_value(self, key):
-        self._delete_a_key(key=key)
-
-    def _keys_of_a_prefix(self, prefix):
-        if isinstance(prefix, list):
-            prefix = self._list_to_key(key_list=prefix)
-        if len(prefix) == 0:
-            prefix = "*"
-        else:
-            prefix = f"{prefix}/*"
-        prefix = f"{self.root}/{prefix}"
-
-        # Note that scanning can be too slow!
-        # So do not abuse this function.
-        l = [e.decode() for e in r.scan_iter(prefix)]
-        return l
-
-    def delete_all_keys(self):
-        for key in self._keys_of_a_prefix(prefix=""):
-            self._delete_a_key(key=key)
-
-    def subscribe_channels(self, channels):
-        sub = r.pubsub()
-        sub.subscribe(*channels)
-        return sub
+from hey.backend.ipc.base import BaseIPC
+
+_clients = {}
 
-    def publish_a_value(self, channel, value):
-        r.publish(
-            channel=channel,
-            message=pickle.dumps(value)
+
+def _get_client(host, port, db):
+    # One connection pool per server and process, shared by all RedisIPC instances
+    address = (host, port, db)
+    if address not in _clients:
+        redis_pool = redis.ConnectionPool(
+            host=host,
+            port=port,
+            db=db,
+            socket_keepalive=True,
+            socket_keepalive_options={
+                socket.TCP_KEEPCNT: 2,
+                socket.TCP_KEEPINTVL: 30
+            }
         )
+        _clients[address] = redis.Redis(connection_pool=redis_pool)
+    return _clients[address]
+
+
+class RedisIPC(BaseIPC):
+    SCAN_BATCH_SIZE = 1000
+    UNLINK_BATCH_SIZE = 1000
+
+    def __init__(self, root, host='127.0.0.1', port=6379, db=0, key_ttl_in_sec=24 * 3600):
+        super().__init__(root)
+        self.host = host
+        self.port = port
+        self.db = db
+        # Keys expire by themselves if a run never gets to clean up, e.g., when killed.
+        # Every write renews the TTL, so it only has to outlast idle periods.
+        self.key_ttl_in_sec = key_ttl_in_sec
+
+    @property
+    def client(self):  # not kept as an attribute so that instances stay picklable
+        return _get_client(self.host, self.port, self.db)
+
+    def _set_a_value(self, key, raw_value):
+        self.client.set(name=key, value=raw_value, ex=self.key_ttl_in_sec)
+
+    def _get_a_value(self, key):
+        return self.client.get(key)
+
+    def _delete_keys(self, keys):
+        # UNLINK frees the memory in the background, and batches go in one round trip
+        pipeline = self.client.pipeline(transaction=False)
+        for i in range(0, len(keys), self.UNLINK_BATCH_SIZE):
+            pipeline.unlink(*keys[i:i + self.UNLINK_BATCH_SIZE])
+        pipeline.execute()
+
+    def _push_a_value(self, key, raw_value):
+        pipeline = self.client.pipeline(transaction=False)
+        pipeline.rpush(key, raw_value)
+        pipeline.expire(key, self.key_ttl_in_sec)
+        pipeline.execute()
+
+    def _pop_a_value(self, key, blocking, timeout):
+        if blocking:
+            # Waiting inside Redis costs no commands, however many workers wait
+            item = self.client.blpop([key], timeout=timeout)
+            return item[1] if item else None
+        return self.client.lpop(key)
+
+    def _set_a_field(self, key, field, raw_value):
+        pipeline = self.client.pipeline(transaction=False)
+        pipeline.hset(name=key, key=field, value=raw_value)
+        pipeline.expire(key, self.key_ttl_in_sec)
+        pipeline.execute()
+
+    def _get_fields(self, key, fields):
+        return self.client.hmget(name=key, keys=fields)  # a single round trip
+
+    def _scan_keys(self, pattern):
+        return [e.decode() for e in self.client.scan_iter(match=pattern, count=self.SCAN_BATCH_SIZE)]
+
+    def _publish_a_value(self, channel, raw_value):
+        self.client.publish(channel=channel, message=raw_value)
+
+    def _subscribe_channels(self, channels):
+        sub = self.client.pubsub()
+        sub.subscribe(*channels)
+        return sub
@@ -0,0 +1,32 @@
+import os
+import json
+import uuid
+from hey.backend.ipc.redis import RedisIPC
+from hey.backend.ipc.local import LocalIPC
+
+registered_ipcs = {
+    'redis': RedisIPC,
+    'local': LocalIPC
+}
+
+# Workers and MCP servers are started without the configuration,
+# so the main process hands its choice down through the environment
+IPC_CONFIG_ENV_VAR = "HEY_IPC_CONFIG"
+
+
+def set_up_ipc(config, root="hey"):
+    """Called once by the main process with the `environment.ipc` section of config.yml."""
+    ipc_config = dict(config or {})
+    ipc_config.setdefault('type', 'redis')
+    ipc_config = registered_ipcs[ipc_config['type']].prepare(ipc_config)
+
+    # Each run writes keys and publishes on channels under its own namespace, so
+    # that it never has to clean up after (or collide with) earlier or concurrent runs
+    ipc_config['root'] = f"{root}/{uuid.uuid4().hex[:12]}"
+    os.environ[IPC_CONFIG_ENV_VAR] = json.dumps(ipc_config)
+
+
+def get_ipc():
+    ipc_config = json.loads(os.environ.get(IPC_CONFIG_ENV_VAR, '{"type": "redis", "root": "hey"}'))
+    ipc_type = ipc_config.pop('type')
+    return registered_ipcs[ipc_type](**ipc_config)
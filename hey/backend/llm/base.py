@@ -1,7 +1,39 @@
+import os
+import logging
 from abc import abstractmethod, ABCMeta
 
 
+class ErrorResponse(str):
+    """What `get_response` returns when the call failed: the error and its traceback.
+
+    Still a string for callers that only read the text, but distinguishable by
+    those that must not keep it, e.g., caches.
+    """
+
+
 class BaseLLM(metaclass=ABCMeta):
     @abstractmethod
     def get_response(self, user_query, system_prompt=None):
         pass
+
+    def log_prefix_reuse(self, messages, completion):
+        """Log how much of this prompt repeats the previous one and how much the provider cached.
+
+        The locally measured shared prefix shows what could be served from the
+        provider's prompt cache, while `cached_tokens` shows what actually was.
+        """
+        prompt = "".join(
+            message["content"] for message in messages
+            if isinstance(message["content"], str)
+        )
+        previous_prompt = getattr(self, "_previous_prompt", "")
+        shared_prefix_length = len(os.path.commonprefix([prompt, previous_prompt]))
+        self._previous_prompt = prompt
+
+        usage = getattr(completion, "usage", None)
+        prompt_tokens = getattr(usage, "prompt_tokens", None)
+        details = getattr(usage, "prompt_tokens_details", None)
+        cached_tokens = getattr(details, "cached_tokens", None)
+        logging.info(f"[Prefix reuse] model: {self.model_name}, "
+                     f"shared prefix: {shared_prefix_length}/{len(prompt)} chars, "
+                     f"cached: {cached_tokens}/{prompt_tokens} tokens")
@@ -14,7 +14,7 @@ import hashlib
 import logging
 import traceback
 from openai import OpenAI
-from hey.backend.llm.base import BaseLLM
+from hey.backend.llm.base import BaseLLM, ErrorResponse
 
 _global_endpoints = {}
 
@@ -74,8 +74,9 @@ class OpenAILLM(BaseLLM):
         try:
             completion = endpoint.chat.completions.create(**payload)
             response = completion.choices[0].message.content
+            self.log_prefix_reuse(payload["messages"], completion)
         except Exception as e:
-            response = f"{e}/{traceback.format_exc()}"
+            response = ErrorResponse(f"{e}/{traceback.format_exc()}")
 
         if verbose:
             logging.info(f"Response got:\n{response}")
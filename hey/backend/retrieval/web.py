@@ -1,12 +1,29 @@
+import os
+import time
 import logging
+import threading
 import tiktoken
 import requests
 import traceback
+import urllib.parse
+import concurrent.futures
 from munch import DefaultMunch
 from bs4 import BeautifulSoup
 from googlesearch import search
+from hey.backend.llm.base import ErrorResponse
 from hey.backend.llm.registry import get_llm
 from hey.utils.misc import extract_json_from_string
+from hey.utils.cache import DiskCache, hash_content
+
+# Faster HTML parsers, in order of preference; BeautifulSoup is the fallback
+try:
+    from selectolax.parser import HTMLParser
+except ImportError:
+    HTMLParser = None
+try:
+    from lxml import html as lxml_html
+except ImportError:
+    lxml_html = None
 
 
 summary_content_system_prompt = """You are an expert summarizer. 
@@ -26,6 +43,17 @@ Below are a list of summaries of different sections from an article.
 Please do a meta-summary of them by extracting all key facts related to the user query, and omitting fluff.
 """
 
+# Page parts that are dropped before extracting the text
+BOILERPLATE_TAGS = ["script", "style", "noscript", "template", "svg", "iframe", "nav", "aside", "footer"]
+# The main content is preferred over the whole page if it has at least this much text
+MIN_MAIN_CONTENT_LENGTH = 200
+MAIN_CONTENT_XPATH = "//main|//article"
+
+# For chunks to end at, searched for within the last tokens before the limit
+PARAGRAPH_SEPARATORS = (b"\n\n",)
+SENTENCE_SEPARATORS = tuple(s.encode("utf-8") for s in (". ", "! ", "? ", "\n", "。", "！", "？"))
+BOUNDARY_SEARCH_RATIO = 0.1
+
 summary_content_user_query_template = """
 User query: {query}
 Text:
@@ -34,10 +62,64 @@ Text:
 """
 
 
+_encoder = None
+_session = None
+_session_lock = threading.Lock()
+
+
+def _get_encoder():
+    global _encoder
+    if _encoder is None:
+        _encoder = tiktoken.encoding_for_model("gpt-4")
+    return _encoder
+
+
+def _decode_utf8_slice(data, start, end):
+    # Tokens may split a multi-byte character, which is then kept whole
+    while 0 < start < len(data) and data[start] & 0xC0 == 0x80:
+        start -= 1
+    while end < len(data) and data[end] & 0xC0 == 0x80:
+        end += 1
+    return data[start:end].decode("utf-8", errors="replace")
+
+
+def _get_session():
+    # Shared by all fetches of the process, so that connections (and TLS handshakes)
+    # to the same hosts are reused across pages and searches
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_connections=16, pool_maxsize=16)
+            _session.mount("http://", adapter)
+            _session.mount("https://", adapter)
+        return _session
+
+
 class Web:
-    def __init__(self, num_url_results=3, page_timeout=10, blacklist=None):  # avoid hard-coding
+    META_SUMMARY_FAN_IN = 8  # summaries merged by one meta-summary call
+    # Cached pages and search results younger than these are used without asking the network
+    PAGE_FRESHNESS_IN_SEC = 3600
+    SEARCH_FRESHNESS_IN_SEC = 3600
+    # Only this much of a page is downloaded, which is far more than what gets summarized well
+    MAX_PAGE_SIZE_IN_BYTES = 4 * 1024 * 1024
+    DOWNLOAD_CHUNK_SIZE_IN_BYTES = 64 * 1024
+
+    def __init__(self, num_url_results=3, page_timeout=10, url_deadline=120,
+                 max_concurrent_chunks=4, blacklist=None, cache_dir=None):  # avoid hard-coding
         self.num_url_results = num_url_results
         self.page_timeout = page_timeout
+        self.url_deadline = url_deadline  # for fetching and summarizing one page
+        self.max_concurrent_chunks = max_concurrent_chunks  # per page
+
+        # Retried searches (e.g., after the critic amends the arguments)
+        # mostly hit the same pages, which are then neither refetched nor resummarized
+        if cache_dir is None:
+            self.search_cache = self.page_cache = self.summary_cache = None
+        else:
+            self.search_cache = DiskCache(os.path.join(cache_dir, "searches"), max_size_in_bytes=16 * 1024 * 1024)
+            self.page_cache = DiskCache(os.path.join(cache_dir, "pages"))
+            self.summary_cache = DiskCache(os.path.join(cache_dir, "summaries"), max_size_in_bytes=64 * 1024 * 1024)
 
         llm_config = {
             "type": "openai",
@@ -66,23 +148,146 @@ class Web:
             logging.error(error)
         return urls, error
 
+    def search_urls(self, query):
+        cache_key = (query, self.num_url_results)
+        if self.search_cache is not None:
+            cached = self.search_cache.get(cache_key)
+            if cached is not None and time.time() - cached["searched_at"] < self.SEARCH_FRESHNESS_IN_SEC:
+                logging.info(f"Search results for {query} served from the cache")
+                return cached["urls"], ""
+
+        urls, error = self.url_search_via_google(query, self.num_url_results)
+        if self.search_cache is not None and urls and not error:
+            self.search_cache.set(cache_key, {"urls": urls, "searched_at": time.time()})
+        return urls, error
+
     @staticmethod
-    def fetch_page_content(url, timeout=10):
+    def normalize_url(url):
+        parts = urllib.parse.urlsplit(url.strip())
+        scheme = parts.scheme.lower()
+        netloc = parts.netloc.lower()
+        default_port = {"http": ":80", "https": ":443"}.get(scheme)
+        if default_port and netloc.endswith(default_port):
+            netloc = netloc[:-len(default_port)]
+        query = urllib.parse.urlencode(sorted(urllib.parse.parse_qsl(parts.query, keep_blank_values=True)))
+        return urllib.parse.urlunsplit((scheme, netloc, parts.path or "/", query, ""))  # without the fragment
+
+    @staticmethod
+    def _main_content_or(root, main_nodes, get_text):
+        for node in main_nodes[:1]:
+            text = get_text(node)
+            if len(text) >= MIN_MAIN_CONTENT_LENGTH:
+                return text
+        return get_text(root)
+
+    @staticmethod
+    def html_to_text(body):
+        """Extract the readable text of an HTML document given as bytes."""
+        if HTMLParser is not None:
+            tree = HTMLParser(body)
+            tree.strip_tags(BOILERPLATE_TAGS)
+            return Web._main_content_or(
+                tree.body or tree.root, tree.css("main, article"),
+                lambda node: node.text(separator=" ", strip=True)
+            )
+
+        if lxml_html is not None:
+            try:
+                document = lxml_html.fromstring(body)
+            except Exception:  # e.g., an empty document
+                return ""
+            for element in document.xpath("|".join(f"//{tag}" for tag in BOILERPLATE_TAGS)):
+                element.drop_tree()
+            return Web._main_content_or(
+                document, document.xpath(MAIN_CONTENT_XPATH),
+                lambda node: " ".join(s.strip() for s in node.itertext() if s.strip())
+            )
+
+        soup = BeautifulSoup(body, "html.parser")
+        for tag in soup(BOILERPLATE_TAGS):
+            tag.decompose()
+        return Web._main_content_or(
+            soup, soup.find_all(["main", "article"]),
+            lambda node: node.get_text(separator=" ", strip=True)
+        )
+
+    @staticmethod
+    def _read_body(response, url):
+        content_length = response.headers.get("Content-Length")
+        if content_length and content_length.isdigit() and int(content_length) > Web.MAX_PAGE_SIZE_IN_BYTES:
+            logging.warning(f"Only the first {Web.MAX_PAGE_SIZE_IN_BYTES} of {content_length} bytes "
+                            f"of {url} are read")
+
+        body = bytearray()
+        for data in response.iter_content(chunk_size=Web.DOWNLOAD_CHUNK_SIZE_IN_BYTES):
+            body += data
+            if len(body) >= Web.MAX_PAGE_SIZE_IN_BYTES:
+                del body[Web.MAX_PAGE_SIZE_IN_BYTES:]
+                break
+        return bytes(body)
+
+    @staticmethod
+    def fetch_page_content(url, timeout=10, page_cache=None):
+        cache_key = None
+        cached = None
+        headers = {}
+        if page_cache is not None:
+            cache_key = Web.normalize_url(url)
+            cached = page_cache.get(cache_key)
+            if cached is not None:
+                if time.time() - cached["fetched_at"] < Web.PAGE_FRESHNESS_IN_SEC:
+                    logging.info(f"Content of {url} served from the cache (length: {len(cached['text'])})")
+                    return cached["text"], True
+
+                # Stale entries are revalidated, which costs no body if the page is unchanged
+                if cached.get("etag"):
+                    headers["If-None-Match"] = cached["etag"]
+                if cached.get("last_modified"):
+                    headers["If-Modified-Since"] = cached["last_modified"]
+
+        try:
+            # Streamed, so that the headers are checked before any of the body is downloaded
+            response = _get_session().get(url, timeout=timeout, verify=False, headers=headers, stream=True)
+        except Exception as e:
+            logging.error(f"Failed to fetch {url} due to {e}")
+            return f"{traceback.format_exc()}", False
+
+        with response:  # releases the connection even if the body is not (fully) read
+            return Web._process_response(url, response, page_cache, cache_key, cached)
+
+    @staticmethod
+    def _process_response(url, response, page_cache, cache_key, cached):
         try:
-            response = requests.get(url, timeout=timeout, verify=False)
+            if response.status_code == 304 and cached is not None:
+                cached["fetched_at"] = time.time()
+                page_cache.set(cache_key, cached)
+                logging.info(f"Content of {url} revalidated in the cache (length: {len(cached['text'])})")
+                return cached["text"], True
+
             content_type = response.headers.get('Content-Type', '')
             if "application/pdf" in content_type:
                 logging.warning(f"Skipped fetching content online from {url} as it links to a PDF document. "
                                 f"You can try downloading and reading the file instead.")
                 return "Skipped: PDF document detected.", False
+            if content_type.startswith(("image/", "audio/", "video/", "application/octet-stream", "application/zip")):
+                logging.warning(f"Skipped fetching content online from {url} as it links to {content_type}. "
+                                f"You can try downloading and reading the file instead.")
+                return f"Skipped: non-text content ({content_type}) detected.", False
 
             if response.status_code == 200:
-                soup = BeautifulSoup(response.text, "html.parser")
-                # Remove unwanted tags (scripts, styles)
-                for script in soup(["script", "style"]):
-                    script.decompose()
-                text = soup.get_text(separator=" ", strip=True)
+                body = Web._read_body(response, url)
+                if "html" in content_type or not content_type:
+                    text = Web.html_to_text(body)
+                else:  # e.g., plain text or JSON
+                    text = body.decode(response.encoding or "utf-8", errors="replace")
                 logging.info(f"Content fetched from {url} (length: {len(text)})")
+                if page_cache is not None:
+                    page_cache.set(cache_key, {
+                        "text": text,
+                        "etag": response.headers.get("ETag"),
+                        "last_modified": response.headers.get("Last-Modified"),
+                        "fetched_at": time.time()
+                    })
                 return text, True
             else:
                 logging.error(f"Failed to fetch {url} as "
@@ -96,96 +301,226 @@ class Web:
             return f"{traceback.format_exc()}", False
 
     @staticmethod
-    def chunk_text(text, max_tokens, overlap=0):
-        """Split `text` into token-limited chunks, with optional token overlap."""
-        enc = tiktoken.encoding_for_model("gpt-4")
-        tokens = enc.encode(text)
+    def _find_boundary(enc, tokens, data, earliest, end, end_byte):
+        """Return the token index in (earliest, end], and its byte offset, that starts right
+        after the last paragraph or, failing that, sentence break, or `end` if there is none."""
+        earliest_byte = end_byte - len(enc.decode_bytes(tokens[earliest:end]))
+        window = data[earliest_byte:end_byte]
+        for separators in (PARAGRAPH_SEPARATORS, SENTENCE_SEPARATORS):
+            pos, separator = max((window.rfind(separator), separator) for separator in separators)
+            if pos == -1:
+                continue
+
+            target_byte = earliest_byte + pos + len(separator)
+            index, byte = earliest, earliest_byte
+            while index < end and byte < target_byte:
+                byte += len(enc.decode_single_token_bytes(tokens[index]))
+                index += 1
+            if earliest < index <= end:
+                return index, byte
+        return end, end_byte
+
+    @staticmethod
+    def chunk_text(text, max_tokens, overlap=0, snap_to_boundaries=False):
+        """Split `text` into token-limited chunks, with optional token overlap.
+
+        The text is tokenized once, and chunks are sliced out of its bytes by
+        offsets that are only computed at chunk boundaries. With
+        `snap_to_boundaries`, a chunk may end a little earlier to not cut
+        through a paragraph or sentence.
+        """
+        enc = _get_encoder()
+        tokens = enc.encode(text, disallowed_special=())  # pages may contain e.g. "<|endoftext|>"
+        if len(tokens) <= max_tokens:
+            return [text]
+
+        data = enc.decode_bytes(tokens)
         chunks = []
-        start = 0
+        start, start_byte = 0, 0
         while True:
             end = min(start + max_tokens, len(tokens))
-            chunk_tokens = tokens[start:end]
-            chunks.append(enc.decode(chunk_tokens))
+            end_byte = start_byte + len(enc.decode_bytes(tokens[start:end]))
+            if snap_to_boundaries and end < len(tokens):
+                earliest = max(start + overlap, end - int(max_tokens * BOUNDARY_SEARCH_RATIO))
+                end, end_byte = Web._find_boundary(enc, tokens, data, earliest, end, end_byte)
+            chunks.append(_decode_utf8_slice(data, start_byte, end_byte))
             if end >= len(tokens):
                 break
 
             # step forward but keep overlap
+            start_byte = end_byte - len(enc.decode_bytes(tokens[end - overlap:end]))
             start = end - overlap
         return chunks
 
     def summarize_text_hierarchical(self, original_query, text):
+        """Return the summary, and whether any LLM call behind it failed."""
         # TODO: avoid hard-coding
         MAX_TOKENS_PER_CHUNK = 6000
         CHUNK_OVERLAP_TOKENS = 200
 
         # --- 1) Chunking ---
-        chunks = self.chunk_text(text, MAX_TOKENS_PER_CHUNK, CHUNK_OVERLAP_TOKENS)
+        chunks = self.chunk_text(text, MAX_TOKENS_PER_CHUNK, CHUNK_OVERLAP_TOKENS, snap_to_boundaries=True)
 
         # --- 2) Summarize each chunk ---
-        chunk_summaries = []
-        for chunk in chunks:
-            summary_content_user_query = summary_content_user_query_template.format(
-                query=original_query,
-                content=chunk
-            )
-            raw = self.summary_llm.get_response(
-                system_prompt=summary_content_system_prompt,
-                user_query=summary_content_user_query
-            )
-            try:
-                result = extract_json_from_string(raw)
-                summary = result["summary"].strip()
-                done_flag = bool(result.get("complete", False))
-            except Exception as e:
-                # fallback: if parsing fails, treat the whole raw as summary
-                summary = raw
-                done_flag = False
-
-            chunk_summaries.append(summary)
-            if done_flag:
-                # we got everything we needed: stop fetching/summarizing further
-                break
+        chunk_summaries = self.summarize_chunks(original_query, chunks)
+        failed = any(isinstance(summary, ErrorResponse) for summary in chunk_summaries)
 
         # --- 3) Meta-summarize ---
-        if len(chunk_summaries) > 1:
-            combined = "\n\n".join(chunk_summaries)
-            summary_content_user_query = summary_content_user_query_template.format(
-                query=original_query,
-                content=combined
-            )
-            final_summary = self.summary_llm.get_response(
-                system_prompt=meta_summary_content_system_prompt,
-                user_query=summary_content_user_query
-            )
-        else:
-            final_summary = chunk_summaries[0]
+        summary, meta_failed = self.reduce_summaries(original_query, chunk_summaries)
+        return summary, failed or meta_failed
 
-        return final_summary
+    def summarize_a_chunk(self, original_query, chunk):
+        summary_content_user_query = summary_content_user_query_template.format(
+            query=original_query,
+            content=chunk
+        )
+        raw = self.summary_llm.get_response(
+            system_prompt=summary_content_system_prompt,
+            user_query=summary_content_user_query
+        )
+        if isinstance(raw, ErrorResponse):
+            return raw, False
+        try:
+            result = extract_json_from_string(raw)
+            summary = result["summary"].strip()
+            done_flag = bool(result.get("complete", False))
+        except Exception as e:
+            # fallback: if parsing fails, treat the whole raw as summary
+            summary = raw
+            done_flag = False
+        return summary, done_flag
 
-    def serve(self, query):
-        urls, error = self.url_search_via_google(
-            query, self.num_url_results
+    def summarize_chunks(self, original_query, chunks):
+        """Summarize chunks up to the first one reported complete, as a sequential pass would.
+
+        Up to `max_concurrent_chunks` chunks are summarized speculatively ahead.
+        Once a chunk reports completion, later chunks are no longer needed and
+        are cancelled, while earlier ones are still awaited in case one of them
+        is complete as well.
+        """
+        chunk_summaries = [None] * len(chunks)
+        first_complete_index = len(chunks)
+        next_index = 0
+        in_flight = {}  # future -> chunk index
+
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.max_concurrent_chunks)
+        try:
+            while True:
+                while len(in_flight) < self.max_concurrent_chunks and next_index < first_complete_index:
+                    future = executor.submit(self.summarize_a_chunk, original_query, chunks[next_index])
+                    in_flight[future] = next_index
+                    next_index += 1
+                if not in_flight:
+                    break
+
+                done, _ = concurrent.futures.wait(
+                    in_flight, return_when=concurrent.futures.FIRST_COMPLETED
+                )
+                for future in done:
+                    index = in_flight.pop(future)
+                    chunk_summaries[index], done_flag = future.result()
+                    if done_flag:
+                        first_complete_index = min(first_complete_index, index)
+
+                for future, index in list(in_flight.items()):
+                    if index > first_complete_index:
+                        # we got everything we needed: stop summarizing further
+                        future.cancel()
+                        del in_flight[future]
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+        return chunk_summaries[:first_complete_index + 1]
+
+    def meta_summarize(self, original_query, summaries):
+        combined = "\n\n".join(summaries)
+        summary_content_user_query = summary_content_user_query_template.format(
+            query=original_query,
+            content=combined
         )
+        return self.summary_llm.get_response(
+            system_prompt=meta_summary_content_system_prompt,
+            user_query=summary_content_user_query
+        )
+
+    def reduce_summaries(self, original_query, summaries):
+        """Return the meta-summary, and whether any LLM call for it failed."""
+        # A tree of meta-summaries, whose levels are each merged in parallel,
+        # so that long pages cost a few rounds rather than one oversized call
+        failed = False
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_concurrent_chunks) as executor:
+            while len(summaries) > 1:
+                groups = [summaries[i:i + self.META_SUMMARY_FAN_IN]
+                          for i in range(0, len(summaries), self.META_SUMMARY_FAN_IN)]
+                summaries = list(executor.map(
+                    lambda group: group[0] if len(group) == 1
+                    else self.meta_summarize(original_query, group),
+                    groups
+                ))
+                failed = failed or any(isinstance(summary, ErrorResponse) for summary in summaries)
+        return summaries[0], failed
+
+    def serve(self, query):
+        urls, error = self.search_urls(query)
         if error:
             return {"result": "", "error": error}
 
+        # Pages are fetched and summarized concurrently, so the latency is
+        # that of the slowest page (bounded by the deadline) rather than the sum
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=max(len(urls), 1))
+        futures = {
+            url: executor.submit(self.fetch_and_summarize, query, url)
+            for url in urls if not any(pattern in url for pattern in self.blacklist)
+        }
+        concurrent.futures.wait(futures.values(), timeout=self.url_deadline)
+        executor.shutdown(wait=False, cancel_futures=True)
+
         result = []
         other = []
-        for url in urls:
-            if any(pattern in url for pattern in self.blacklist):
+        for url in urls:  # in the order of ranking
+            if url not in futures:
                 result.append({
                     "url": url,
                     "fetched content": "Not fetched as the url is in the blacklist."
                 })
                 continue
 
-            content, succeeded = self.fetch_page_content(
-                url, self.page_timeout
-            )
+            future = futures[url]
+            if not future.done():
+                logging.error(f"Gave up on {url} after {self.url_deadline}s")
+                other.append({"url": url, "error": f"Not fetched and summarized within {self.url_deadline}s."})
+                continue
+
+            try:
+                summarized_content, succeeded = future.result()
+            except Exception as e:
+                logging.error(f"Failed to summarize {url} due to {e}")
+                summarized_content, succeeded = f"{traceback.format_exc()}", False
             if succeeded:
-                summarized_content = self.summarize_text_hierarchical(query, content)
                 result.append({"url": url, "fetched content (summarized)": summarized_content})
             else:
-                other.append({"url": url, "error": content})
+                other.append({"url": url, "error": summarized_content})
 
         return {"result": result + other, "error": ""}
+
+    def fetch_and_summarize(self, query, url):
+        content, succeeded = self.fetch_page_content(
+            url, self.page_timeout, self.page_cache
+        )
+        if not succeeded:
+            return content, False
+
+        if self.summary_cache is None:
+            summary, _ = self.summarize_text_hierarchical(query, content)
+            return summary, True
+
+        # Keyed by the content rather than the URL, so that a changed page is resummarized
+        cache_key = (hash_content(content), query, self.summary_llm.model_name)
+        summary = self.summary_cache.get(cache_key)
+        if summary is None:
+            summary, failed = self.summarize_text_hierarchical(query, content)
+            if not failed:  # otherwise retries would keep getting the error
+                self.summary_cache.set(cache_key, summary)
+        else:
+            logging.info(f"Summary of {url} served from the cache")
+        return summary, True
@@ -0,0 +1,167 @@
+import os
+import sys
+import json
+import socket
+import hashlib
+import logging
+import tempfile
+import threading
+import traceback
+from contextlib import redirect_stdout
+
+from hey.agents.registry import get_agent
+from hey.environments.registry import get_environment
+
+
+def get_socket_path(working_dir):
+    # One daemon per working directory, as the configuration lives there.
+    # Hashed to stay within the length limit of Unix socket paths.
+    dir_hash = hashlib.md5(os.path.abspath(working_dir).encode()).hexdigest()[:12]
+    return os.path.join(tempfile.gettempdir(), f"hey-{dir_hash}.sock")
+
+
+def _send(conn, message):
+    conn.sendall((json.dumps(message) + "\n").encode("utf-8"))
+
+
+class ClientChannel:
+    """The connection to one client, used as stdout and as the user's terminal."""
+    REPLY_SLACK_IN_SEC = 5
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.reader = conn.makefile("r", encoding="utf-8")
+        self.lock = threading.Lock()
+        self.disconnected = False
+
+    def send(self, message):
+        with self.lock:
+            if self.disconnected:
+                return
+            try:
+                _send(self.conn, message)
+            except OSError:
+                # The client has gone away; keep serving so that the agent ends cleanly
+                self.disconnected = True
+
+    def write(self, text):
+        if text:
+            self.send({"type": "output", "text": text})
+        return len(text)
+
+    def flush(self):
+        pass
+
+    def receive(self, timeout=None):
+        self.conn.settimeout(timeout)
+        try:
+            line = self.reader.readline()
+        except OSError:  # including timeouts
+            return None
+        finally:
+            self.conn.settimeout(None)
+        return json.loads(line) if line else None
+
+    def ask(self, prompt, timeout):
+        self.send({"type": "input", "prompt": prompt, "timeout": timeout})
+        if self.disconnected:
+            return None
+
+        # The client times out by itself, so it is given a little slack to reply
+        reply = self.receive(timeout=timeout + self.REPLY_SLACK_IN_SEC)
+        return reply.get("answer") if reply else None
+
+
+def _daemon_is_running(socket_path):
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        client.connect(socket_path)
+        return True
+    except OSError:
+        return False
+    finally:
+        client.close()
+
+
+def run_daemon(config):
+    socket_path = get_socket_path(config.working_dir)
+    if os.path.exists(socket_path):
+        if _daemon_is_running(socket_path):
+            print(f"A daemon is already serving {config.working_dir} at {socket_path}")
+            return
+        os.remove(socket_path)  # left behind by a daemon that did not exit cleanly
+
+    # Everything expensive is built once and reused by all later queries
+    environment = get_environment(config)
+    agent = get_agent(config.agent, environment)
+    agent.warm_up()
+
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(socket_path)
+    os.chmod(socket_path, 0o600)
+    server.listen()
+    print(f"Daemon serving {config.working_dir} at {socket_path}")
+    logging.info(f"Daemon listening at {socket_path}")
+
+    try:
+        while True:
+            conn, _ = server.accept()
+            # One query at a time, as queries share the environment and the workers
+            with conn:
+                try:
+                    channel = ClientChannel(conn)
+                    request = channel.receive()
+                    if not request or not request.get("query"):
+                        continue
+
+                    logging.info(f"Daemon got the query: {request['query']}")
+                    environment.reset()
+                    agent.input_handler = channel.ask
+                    try:
+                        with redirect_stdout(channel):
+                            agent.serve(request["query"])
+                    finally:
+                        agent.input_handler = None
+                    channel.send({"type": "done"})
+                except Exception as e:
+                    logging.error(f"Daemon failed to serve a client due to {e}\n"
+                                  f"{traceback.format_exc()}")
+    except KeyboardInterrupt:
+        print("Daemon stopped")
+    finally:
+        server.close()
+        os.remove(socket_path)
+        agent.shutdown()
+
+
+def send_query_to_daemon(query, working_dir):
+    """Return False if no daemon serves `working_dir`, so that the caller runs the query itself."""
+    socket_path = get_socket_path(working_dir)
+    if not os.path.exists(socket_path):
+        return False
+
+    conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        conn.connect(socket_path)
+    except OSError:
+        conn.close()
+        return False
+
+    with conn:
+        _send(conn, {"query": query})
+        reader = conn.makefile("r", encoding="utf-8")
+        for line in reader:
+            message = json.loads(line)
+            if message["type"] == "output":
+                sys.stdout.write(message["text"])
+                sys.stdout.flush()
+            elif message["type"] == "input":
+                from inputimeout import inputimeout, TimeoutOccurred
+                try:
+                    answer = inputimeout(prompt=message["prompt"], timeout=message["timeout"])
+                except TimeoutOccurred:
+                    answer = None
+                _send(conn, {"answer": answer})
+            elif message["type"] == "done":
+                break
+    return True
@@ -2,4 +2,5 @@ from abc import ABCMeta
 
 
 class BaseEnv(metaclass=ABCMeta):
-    pass
+    def close(self):
+        pass
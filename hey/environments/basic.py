@@ -1,7 +1,7 @@
 import logging
 import os
 import platform
-from hey.backend.ipc.redis import RedisIPC
+from hey.backend.ipc.registry import set_up_ipc, get_ipc
 from hey.environments.base import BaseEnv
 
 
@@ -25,35 +25,34 @@ def _get_os_name():
         return "Unknown Operating System"
 
 
-class BasicEnv(BaseEnv, RedisIPC):
+class BasicEnv(BaseEnv):
     def __init__(self):
-        RedisIPC.__init__(self, root="hey")
+        # The backend and the namespace of the run are chosen by the main process, see `set_up_ipc`
+        self.ipc = get_ipc()
 
     def get_message_subscriber(self, channels):
-        return self.subscribe_channels(channels)
+        return self.ipc.subscribe_channels(channels)
+
+    def get_message_channel(self, message):
+        return self.ipc.channel_of_a_message(message)
 
     def publish_a_message(self, channel, message):
-        self.publish_a_value(
+        self.ipc.publish_a_value(
             channel=channel,
             value=message
         )
 
     def set_data_for_subprocess(self, data, target_pid):
-        self.set_a_shared_value(
+        self.ipc.push_a_shared_value(
             key=[f"{target_pid}", "data_from_main_process"],
             value=data
         )
 
     def get_data_from_main_process(self, target_pid, blocked=False):
-        data = self.get_a_shared_value(
+        return self.ipc.pop_a_shared_value(
             key=[f"{target_pid}", "data_from_main_process"],
-            busy_waiting=blocked
-        )
-        self.delete_a_shared_value(
-            key=[f"{target_pid}",
-                 "data_from_main_process"]
+            blocking=blocked
         )
-        return data
 
 
 class AgentEnv(BasicEnv):
@@ -61,12 +60,9 @@ class AgentEnv(BasicEnv):
     TRUNCATED_TEXT_LENGTH = 2000
 
     def __init__(self, config):
+        set_up_ipc(config.environment.ipc)
         BasicEnv.__init__(self)
-        self.delete_all_keys()
-        self.set_a_shared_value(
-            key=self.COMPLETED_TASK_STATES,
-            value={}
-        )
+        self.reset()
 
         self.os_name = _get_os_name()
         logging.info(f"Recognized OS name: {self.os_name}")
@@ -74,6 +70,14 @@ class AgentEnv(BasicEnv):
         self.log_path = config.log_path
         self.config = config
 
+    def reset(self):
+        """Forget the task states of the previous query."""
+        self.ipc.delete_a_shared_value(key=self.COMPLETED_TASK_STATES)
+
+    def close(self):
+        """Delete what this run has stored; keys missed here expire by themselves."""
+        self.ipc.delete_all_keys()
+
     def get_os_name(self):
         return self.os_name
 
@@ -91,44 +95,33 @@ class AgentEnv(BasicEnv):
         files_and_dirs = os.listdir(working_dir)
         return "\n".join(files_and_dirs)
 
+    # Task states are fields of one hash, so that each access only touches one task
     def update_task_state(self, task_name, task_state):
-        all_task_states = self.get_a_shared_value(key=self.COMPLETED_TASK_STATES)
-
-        state = {
-            task_name: task_state
-        }
-        all_task_states.update(state)
-        self.set_a_shared_value(
+        self.ipc.set_a_shared_field(
             key=self.COMPLETED_TASK_STATES,
-            value=all_task_states
+            field=task_name,
+            value=task_state
         )
 
     def set_task_result(self, task, result):
-        state = {
-            task["name"]: task
-        }
-        state[task["name"]].update({
+        task.update({
             "result": result
         })
+        self.update_task_state(task["name"], task)
 
-        all_task_states = self.get_a_shared_value(key=self.COMPLETED_TASK_STATES)
-        if all_task_states is None:
-            all_task_states = {}
-
-        all_task_states.update(state)
-        self.set_a_shared_value(
+    def get_task_state(self, task_name):
+        return self.ipc.get_a_shared_field(
             key=self.COMPLETED_TASK_STATES,
-            value=all_task_states
+            field=task_name
         )
 
-    def get_task_state(self, task_name):
-        all_task_states = self.get_a_shared_value(key=self.COMPLETED_TASK_STATES)
-        return all_task_states.get(task_name, None)
-
     def get_task_states(self, task_names, clean_retrieval=False):
         task_states = []
-        for task_name in task_names:
-            task_state = self.get_task_state(task_name)
+        all_task_states = self.ipc.get_shared_fields(
+            key=self.COMPLETED_TASK_STATES,
+            fields=task_names
+        )
+        for task_name, task_state in zip(task_names, all_task_states):
             if clean_retrieval:
                 if task_state["tool"] == "do_googlesearch" and "result" in task_state:
                     del task_state["result"]  # avoid overwhelming text
@@ -19,13 +19,6 @@ from typing import List, Optional
 
 import ffmpeg
 from PIL import Image
-from scenedetect import (  # type: ignore[import-untyped]
-    SceneManager,
-    VideoManager,
-)
-from scenedetect.detectors import (  # type: ignore[import-untyped]
-    ContentDetector,
-)
 
 from hey.mcp_tools.camel.agents import ChatAgent
 from hey.mcp_tools.camel.messages import BaseMessage
@@ -33,11 +26,9 @@ from hey.mcp_tools.camel.models import OpenAIAudioModels, BaseModelBackend
 from hey.mcp_tools.camel.toolkits.base import BaseToolkit
 from hey.mcp_tools.camel.toolkits.function_tool import FunctionTool
 from hey.mcp_tools.camel.utils import dependencies_required
+from hey.utils.video import extract_keyframes
 
-from .video_downloader_toolkit import (
-    VideoDownloaderToolkit,
-    _capture_screenshot,
-)
+from .video_downloader_toolkit import VideoDownloaderToolkit
 
 logger = logging.getLogger(__name__)
 
@@ -95,7 +86,7 @@ class VideoAnalysisToolkit(BaseToolkit):
             (default: :obj:`None`)
     """
 
-    @dependencies_required("ffmpeg", "scenedetect")
+    @dependencies_required("ffmpeg", "imageio_ffmpeg")
     def __init__(
         self,
         download_directory: Optional[str] = None,
@@ -165,39 +156,27 @@ class VideoAnalysisToolkit(BaseToolkit):
         return audio_transcript
 
     def _extract_keyframes(
-        self, video_path: str, num_frames: int, threshold: float = 25.0
+        self, video_path: str, num_frames: int, threshold: float = 20.0
     ) -> List[Image.Image]:
         r"""Extract keyframes from a video based on scene changes
         and return them as PIL.Image.Image objects.
 
+        The video is decoded in a single pass, rather than seeked and
+        decoded again for every scene.
+
         Args:
             video_path (str): Path to the video file.
             num_frames (int): Number of keyframes to extract.
-            threshold (float): The threshold value for scene change detection.
+            threshold (float): The mean absolute difference (0-255) between
+                downscaled frames that counts as a scene change.
 
         Returns:
             list: A list of PIL.Image.Image objects representing
                 the extracted keyframes.
         """
-        video_manager = VideoManager([video_path])
-        scene_manager = SceneManager()
-        scene_manager.add_detector(ContentDetector(threshold=threshold))
-
-        video_manager.set_duration()
-        video_manager.start()
-        scene_manager.detect_scenes(video_manager)
-
-        scenes = scene_manager.get_scene_list()
-        keyframes: List[Image.Image] = []
-
-        for start_time, _ in scenes:
-            if len(keyframes) >= num_frames:
-                break
-            frame = _capture_screenshot(video_path, start_time)
-            keyframes.append(frame)
-
-        print(len(keyframes))
-        return keyframes
+        keyframes = extract_keyframes(video_path, num_frames, threshold)
+        logger.info(f"Extracted {len(keyframes)} keyframes from {video_path}")
+        return [frame for _, frame in keyframes]
 
     def ask_question_about_video(
         self,
@@ -1,11 +1,15 @@
 import os
 import asyncio
 import logging
+import itertools
 from contextlib import AsyncExitStack
 
-from mcp import ClientSession, StdioServerParameters
+from mcp import ClientSession, StdioServerParameters, types
 from mcp.client.stdio import stdio_client
 
+# Unique within the process, so that a reconnected client never reuses a version
+_catalog_versions = itertools.count(1)
+
 
 class MCPClient:
     def __init__(self, log_path):
@@ -15,6 +19,18 @@ class MCPClient:
         self.log_path = log_path
         # self._server_process = None
 
+        # (version, tools), where tools being None means that it has to be fetched
+        self.tool_catalog = (next(_catalog_versions), None)
+
+    def invalidate_tool_catalog(self):
+        self.tool_catalog = (next(_catalog_versions), None)
+
+    async def _handle_message(self, message):
+        notification = getattr(message, "root", message)  # wrapped in older versions of mcp
+        if isinstance(notification, types.ToolListChangedNotification):
+            logging.info(f"[MCP Client] Tool list changed on the server")
+            self.invalidate_tool_catalog()
+
     async def connect_to_server(self, server_script_path):
         """Connect to an MCP server
 
@@ -41,7 +57,7 @@ class MCPClient:
         stdio_transport = await self.exit_stack.enter_async_context(stdio_client(server_params))
         self.stdio, self.write = stdio_transport
         self.session = await self.exit_stack.enter_async_context(
-            ClientSession(self.stdio, self.write)
+            ClientSession(self.stdio, self.write, message_handler=self._handle_message)
         )
         # logging.info(f"[MCP Client] {self.stdio.__dict__}")
         # logging.info(f"[MCP Client] {self.session.__dict__}")
@@ -50,14 +66,26 @@ class MCPClient:
 
         await self.session.initialize()
 
-        # List available tools
-        response = await self.session.list_tools()
-        tools = response.tools
+        # List available tools, which also fills a fresh catalog for this server session
+        self.invalidate_tool_catalog()
+        _, tools = await self.get_tool_catalog()
         logging.info(f"[MCP Client] Connected to server with tools: {[tool.name for tool in tools]}")
 
+    async def get_tool_catalog(self):
+        version, tools = self.tool_catalog
+        if tools is None:
+            response = await self.session.list_tools()
+            tools = response.tools
+            if self.tool_catalog[0] == version:  # not invalidated in the meantime
+                self.tool_catalog = (version, tools)
+        return version, tools
+
     async def list_tools(self):
-        response = await self.session.list_tools()
-        return response.tools
+        _, tools = await self.get_tool_catalog()
+        return tools
+
+    async def ping(self):
+        await self.session.send_ping()
 
     async def call_tools(self, tool_name, tool_args):
         # logging.info(f"[Zhifeng] Calling tool {tool_name} with arguments {tool_args}")
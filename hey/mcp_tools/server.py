@@ -4,12 +4,13 @@ import logging
 from mcp.server.fastmcp import FastMCP
 
 from hey.utils.misc import set_log
+from hey.utils.cache import get_cache_dir
 from hey.backend.retrieval.web import Web
 from hey.backend.code.read import SemanticRead
 from hey.backend.code.general_shell import Shell
-from hey.backend.code.python import Python
+from hey.backend.code.python import Python, kernel_pool
 from hey.environments.basic import BasicEnv
-from hey.agents.basic.const import INPUT_REQUIRED
+from hey.agents.basic.const import INPUT_REQUIRED, WARM_UP_KERNELS_ENV_VAR
 
 mcp = FastMCP("native")
 dir_path = os.path.dirname(os.path.realpath(__file__))
@@ -52,18 +53,29 @@ def ask_user(log_path: str, question: str) -> str:
 
 
 @mcp.tool()
-def read_out_file_content(log_path: str, file_path_list: list) -> list:
+def read_out_file_content(log_path: str, file_path_list: list, pages: str = "", query: str = "",
+                          columns: list = None, max_rows: int = 0) -> list:
     """Reading and extracting semantic content from a list of provided or downloaded files
     (supporting text, audio, video, and many other types of files).
     Extremely useful for analyzing file content in later tasks.
 
     Args:
         file_path_list: a list of paths to the files to be read
+        pages: optional, for PDF files only, the pages to read, e.g., "1-3,7"
+        query: optional, for PDF files only, what to look for, so that the most relevant pages of long documents are read
+        columns: optional, for CSV and Excel files only, the names of the columns to read
+        max_rows: optional, for CSV and Excel files only, how many rows to read from the top
     """
 
     common_init(log_path)
-    handler = SemanticRead()
-    return handler.process(file_path_list=file_path_list)
+    handler = SemanticRead(cache_dir=get_cache_dir(log_path, "read"))
+    return handler.process(
+        file_path_list=file_path_list,
+        pages=pages or None,
+        query=query or None,
+        columns=columns or None,
+        max_rows=max_rows or None
+    )
 
 
 @mcp.tool()
@@ -74,7 +86,7 @@ def do_googlesearch(log_path: str, query: str) -> dict:
         query: a combination of keywords to search for
     """
     common_init(log_path)
-    handler = Web()
+    handler = Web(cache_dir=get_cache_dir(log_path, "web"))
     return handler.serve(query)
 
 
@@ -86,7 +98,7 @@ def shell_code_task(log_path: str, specific_goal: str) -> dict:
         specific_goal: in natural language, specify what you want to achieve using shell code, with necessary context and details.
     """
     common_init(log_path)
-    handler = Shell()
+    handler = Shell(cache_dir=get_cache_dir(log_path, "code"))
     return handler.serve(specific_goal)
 
 
@@ -98,9 +110,14 @@ def python_code_task(log_path: str, specific_goal: str) -> dict:
         specific_goal: in natural language, specify what you want to achieve using Python code, with necessary context and details.
     """
     common_init(log_path)
-    handler = Python()
+    handler = Python(cache_dir=get_cache_dir(log_path, "code"))
     return handler.serve(specific_goal)
 
 
 if __name__ == "__main__":
+    # Not in the planner's server, which only lists the tools
+    if os.getenv(WARM_UP_KERNELS_ENV_VAR) == "1":
+        # Kernels inherit the environment, so it is loaded before they start
+        dotenv.load_dotenv(dotenv_path=os.path.join(dir_path, '..', '..', '.env'), override=True)
+        kernel_pool.warm_up()
     mcp.run(transport='stdio')
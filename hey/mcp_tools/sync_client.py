@@ -7,25 +7,42 @@ from hey.mcp_tools.client import MCPClient  # Adjust the import based on your fi
 
 dir_path = os.path.dirname(os.path.realpath(__file__))
 _mcp_client = None
+_mcp_client_lock = threading.Lock()
 
 
-def get_mcp_client(log_path=None, server_script_file=None):
+def get_mcp_client(log_path=None, server_script_file=None, check_health=False):
     global _mcp_client
-    if _mcp_client is None:
-        _mcp_client = SyncMCPClient(
-            log_path=log_path,
-            server_script_file=server_script_file
-        )
-        _mcp_client.connect_to_server()
+    with _mcp_client_lock:  # replanning threads may ask for it concurrently
+        if _mcp_client is not None and check_health and not _mcp_client.is_healthy():
+            logging.warning("[Sync MCP Client] MCP server is unresponsive. Reconnecting")
+            _mcp_client.close()
+            _mcp_client = None
+        if _mcp_client is None:
+            _mcp_client = SyncMCPClient(
+                log_path=log_path,
+                server_script_file=server_script_file
+            )
+            _mcp_client.connect_to_server()
     return _mcp_client
 
 
+def close_mcp_client():
+    global _mcp_client
+    with _mcp_client_lock:
+        if _mcp_client is not None:
+            _mcp_client.close()
+            _mcp_client = None
+
+
 # import concurrent.futures, asyncio, traceback, sys, threading
 
 
 class SyncMCPClient:
+    HEALTH_CHECK_TIMEOUT_IN_SEC = 5
+
     def __init__(self, log_path=None, server_script_file=None):
         self._client = MCPClient(log_path=log_path)
+        self._tool_dicts = (None, None)
         # Create a dedicated event loop.
         self._loop = asyncio.new_event_loop()
 
@@ -42,14 +59,14 @@ class SyncMCPClient:
         asyncio.set_event_loop(self._loop)
         self._loop.run_forever()
 
-    def _run(self, coro):
+    def _run(self, coro, timeout=None):
         # if not (self._thread and self._thread.is_alive()):
         #     raise RuntimeError(
         #         "Event‑loop thread is not running in this process. "
         #         "Create a new SyncMCPClient inside the worker process."
         #     )
         future = asyncio.run_coroutine_threadsafe(coro, self._loop)
-        return future.result()
+        return future.result(timeout=timeout)
 
     def connect_to_server(self):
         """Synchronously connect to the server and return the list of tools."""
@@ -57,18 +74,32 @@ class SyncMCPClient:
             self._client.connect_to_server(self.server_script_path)
         )
 
-    def list_tools(self, return_dict=True):
-        """Synchronously list available tools."""
-        tools = self._run(
-            self._client.list_tools()
-        )
-        if return_dict:
-            tools = [{
+    def get_tool_catalog(self):
+        """Return (version, tools as dicts). The server is asked only when the catalog is stale."""
+        version, tools = self._client.tool_catalog
+        if tools is None:
+            version, tools = self._run(
+                self._client.get_tool_catalog()
+            )
+
+        cached_version, tool_dicts = self._tool_dicts
+        if cached_version != version:
+            tool_dicts = [{
                 "name": tool.name,
                 "description": tool.description,
                 "input_schema": tool.inputSchema
             } for tool in tools]
+            self._tool_dicts = (version, tool_dicts)
+        return version, tool_dicts
 
+    def list_tools(self, return_dict=True):
+        """Synchronously list available tools."""
+        if return_dict:
+            _, tools = self.get_tool_catalog()
+        else:
+            tools = self._run(
+                self._client.list_tools()
+            )
         return tools
 
     def call_tool(self, tool_name, tool_args):
@@ -85,3 +116,22 @@ class SyncMCPClient:
         return self._run(
             self._client.cleanup()
         )
+
+    def is_healthy(self):
+        """Check that the server still answers, without waiting on a hung one."""
+        if not self._thread.is_alive():
+            return False
+        try:
+            self._run(self._client.ping(), timeout=self.HEALTH_CHECK_TIMEOUT_IN_SEC)
+            return True
+        except Exception as e:
+            logging.warning(f"[Sync MCP Client] Health check failed due to {e}")
+            return False
+
+    def close(self):
+        """Best-effort shutdown. The server also exits by itself once our end of stdio closes."""
+        try:
+            self._run(self._client.cleanup(), timeout=self.HEALTH_CHECK_TIMEOUT_IN_SEC)
+        except Exception as e:
+            logging.debug(f"[Sync MCP Client] Cleanup not completed due to {e}")
+        self._loop.call_soon_threadsafe(self._loop.stop)
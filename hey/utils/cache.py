@@ -0,0 +1,109 @@
+import os
+import json
+import pickle
+import hashlib
+import logging
+import tempfile
+import threading
+
+CACHE_DIR_NAME = ".hey_cache"
+
+
+def get_cache_dir(log_path, name):
+    """Caches live in the working directory, where the log of the run is also written."""
+    return os.path.join(os.path.dirname(os.path.abspath(log_path)), CACHE_DIR_NAME, name)
+
+
+def hash_content(content):
+    if isinstance(content, str):
+        content = content.encode("utf-8")
+    return hashlib.sha256(content).hexdigest()
+
+
+class DiskCache():
+    """A persistent key-value cache shared by all processes of a working directory.
+
+    Keys are JSON-serializable values (e.g., tuples of strings), stored under
+    their SHA-256. Writes are atomic renames, so concurrent readers never see
+    a partial entry, and reads refresh the mtime that the size-bounded LRU
+    eviction is based on.
+    """
+    EVICTION_TARGET_RATIO = 0.9  # evicting a bit more than needed to not evict on every write
+
+    def __init__(self, root, max_size_in_bytes=512 * 1024 * 1024):
+        self.root = root
+        self.max_size_in_bytes = max_size_in_bytes
+        self._size_in_bytes = None  # estimated, and only computed once writes begin
+        self._lock = threading.Lock()
+
+    def _path_of(self, key):
+        digest = hashlib.sha256(json.dumps(key, sort_keys=True).encode("utf-8")).hexdigest()
+        return os.path.join(self.root, digest[:2], f"{digest}.pkl")
+
+    def get(self, key, default=None):
+        path = self._path_of(key)
+        try:
+            with open(path, "rb") as fin:
+                value = pickle.load(fin)
+            os.utime(path)  # marks it as recently used
+            return value
+        except FileNotFoundError:
+            return default
+        except Exception as e:  # e.g., an entry written by an incompatible version
+            logging.warning(f"Ignored the unreadable cache entry {path} due to {e}")
+            return default
+
+    def set(self, key, value):
+        path = self._path_of(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+            with os.fdopen(fd, "wb") as fout:
+                pickle.dump(value, fout)
+            os.replace(tmp_path, path)
+        except Exception as e:  # caching is best-effort
+            logging.warning(f"Failed to write the cache entry {path} due to {e}")
+            return
+
+        with self._lock:
+            if self._size_in_bytes is None:
+                self._size_in_bytes = sum(size for _, _, size in self._entries())
+            else:
+                self._size_in_bytes += os.path.getsize(path)
+            if self._size_in_bytes > self.max_size_in_bytes:
+                self._evict()
+
+    def delete(self, key):
+        try:
+            os.remove(self._path_of(key))
+        except FileNotFoundError:
+            pass
+
+    def _entries(self):
+        entries = []
+        if not os.path.isdir(self.root):
+            return entries
+        for shard in os.scandir(self.root):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:  # removed by another process meanwhile
+                    continue
+                entries.append((stat.st_mtime, entry.path, stat.st_size))
+        return entries
+
+    def _evict(self):
+        entries = sorted(self._entries())  # least recently used first
+        size_in_bytes = sum(size for _, _, size in entries)
+        target = self.max_size_in_bytes * self.EVICTION_TARGET_RATIO
+        for _, path, size in entries:
+            if size_in_bytes <= target:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            size_in_bytes -= size
+        self._size_in_bytes = size_in_bytes
@@ -79,13 +79,20 @@ def set_loguru_log(log_path, log_level="INFO"):
     logger.disable("pydantic")
 
 
-def setup():
-    dotenv.load_dotenv(dotenv_path='.env', override=True)
-
+def parse_args():
     parser = argparse.ArgumentParser()
     parser.add_argument('--working_dir', type=str, default='.',
                         help='path to configuration file')
+    parser.add_argument('--daemon', action='store_true',
+                        help='run as a resident service that later queries are sent to')
     args, _ = parser.parse_known_args()  # <-- Ignore unrecognized arguments
+    return args
+
+
+def setup():
+    dotenv.load_dotenv(dotenv_path='.env', override=True)
+
+    args = parse_args()
 
     timestamp = datetime.now().strftime("%Y%m%d-%H%M%S")
     log_filename = f"{timestamp}.log"
@@ -0,0 +1,53 @@
+import heapq
+import logging
+import numpy as np
+from PIL import Image
+
+# Otherwise warns about every read, as frames are scaled on purpose
+logging.getLogger("imageio_ffmpeg").setLevel(logging.ERROR)
+
+SAMPLE_FPS = 2  # frames per second looked at for scene changes
+KEYFRAME_WIDTH = 512
+DIFF_DOWNSCALE_FACTOR = 8  # scene changes are detected on frames this many times smaller
+SCENE_CHANGE_THRESHOLD = 20.0
+
+
+def extract_keyframes(video_path, max_frames, threshold=SCENE_CHANGE_THRESHOLD):
+    """Return up to `max_frames` keyframes of a video as (timestamp, image) pairs in time order.
+
+    The video is decoded once by a single ffmpeg process, which drops frames
+    down to `SAMPLE_FPS` and scales them before they reach Python. A frame is
+    a keyframe if its mean absolute difference (0-255) from the previous
+    sampled frame, both downscaled, exceeds `threshold`. The first frame
+    always is one, and only the `max_frames` most distinct ones are kept in
+    memory while decoding.
+    """
+    import imageio_ffmpeg
+
+    reader = imageio_ffmpeg.read_frames(
+        video_path,
+        input_params=["-an", "-sn"],
+        output_params=["-vf", f"fps={SAMPLE_FPS},scale={KEYFRAME_WIDTH}:-2"]
+    )
+    try:
+        width, height = next(reader)["size"]
+        keyframes = []  # a min-heap of (score, index, frame), so the least distinct is dropped first
+        previous = None
+        for index, raw_frame in enumerate(reader):
+            frame = np.frombuffer(raw_frame, dtype=np.uint8).reshape(height, width, 3)
+            small = frame[::DIFF_DOWNSCALE_FACTOR, ::DIFF_DOWNSCALE_FACTOR].astype(np.int16)
+            score = np.inf if previous is None else float(np.abs(small - previous).mean())
+            previous = small
+            if score < threshold:
+                continue
+            if len(keyframes) < max_frames:
+                heapq.heappush(keyframes, (score, index, frame))
+            elif score > keyframes[0][0]:
+                heapq.heapreplace(keyframes, (score, index, frame))
+    finally:
+        reader.close()  # terminates ffmpeg if stopped early
+
+    return [
+        (index / SAMPLE_FPS, Image.fromarray(frame))
+        for _, index, frame in sorted(keyframes, key=lambda keyframe: keyframe[1])
+    ]
@@ -1,20 +1,34 @@
 import sys
-from hey.utils.misc import setup
+from hey.utils.misc import setup, parse_args
 from hey.agents.registry import get_agent
 from hey.environments.registry import get_environment
+from hey.daemon import run_daemon, send_query_to_daemon
 
 
 def main():
     if len(sys.argv) < 2:
-        print("Usage: hey '<your query>'")
+        print("Usage: hey '<your query>'\n"
+              "       hey --daemon")
         sys.exit(1)
 
+    args = parse_args()
+    if args.daemon:
+        config = setup()
+        run_daemon(config)
+        return
+
     query = " ".join(sys.argv[1:])  # Combine all arguments into a single string
     # query = "Search the web to tell me who Zhifeng Jiang is?"
+    if send_query_to_daemon(query, args.working_dir):
+        return
+
     config = setup()
     environment = get_environment(config)
     agent = get_agent(config.agent, environment)
-    agent.serve(query)
+    try:
+        agent.serve(query)
+    finally:
+        agent.shutdown()
 
 
 if __name__ == '__main__':